@@ -1,7 +1,8 @@
 import logging
+import os
 import sys
 
-from volta_plus import create_app
+from volta_plus import create_app, parse_time
 
 
 logging.basicConfig(
@@ -10,7 +11,14 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-app = create_app(poor=True)
+app = create_app(
+    poor=True,
+    metrics=os.environ.get('VOLTA_METRICS', '') == '1',
+    history_dir=os.environ.get('VOLTA_HISTORY_DIR', None),
+    shared_cache_dir=os.environ.get('VOLTA_SHARED_CACHE', None),
+    # when the poller first ran, weeks of usage for meters stored before first_seen was tracked are counted from it
+    network_epoch=parse_time(os.environ['VOLTA_NETWORK_EPOCH']) if 'VOLTA_NETWORK_EPOCH' in os.environ else None
+)
 
 
 if __name__ == '__main__':
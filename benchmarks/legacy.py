@@ -0,0 +1,139 @@
+# VoltaMeter as it was before MeterStore, kept as the baseline the benchmarks compare against
+import logging
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from volta_plus.models import log_warning
+
+
+class LegacyVoltaMeter:
+    idle_states = {'idle', 'pluggedout'}
+    idle_availabilities = {'available'}
+    in_use_charging_states = {'charging', 'pluggedin'}
+    in_use_charging_availabilities = {'in use', 'plugged in...'}
+    in_use_stopped_states = {'chargestopped'}
+    in_use_stopped_availabilities = {'in use'}
+
+    class InUseStats:
+        def __init__(self):
+            self.start = None
+            self.cnt = 0
+            self.avg = 0
+
+        def update_avg(self, utc_time):
+            self.cnt += 1
+
+            duration = (utc_time - self.start).total_seconds()
+            self.avg += (duration - self.avg) / self.cnt
+
+            self.start = None
+
+        def serialize(self):
+            if self.start is not None:
+                self.start._nanosecond = 0
+            return {
+                'start': self.start,
+                'cnt': self.cnt,
+                'avg': self.avg
+            }
+
+    def __init__(self):
+        self.state = None
+        self.availability = None
+
+        self.in_use_charging_stats = self.InUseStats()
+        self.in_use_stopped_stats = self.InUseStats()
+
+        self.weekly_usage_update = -1
+        self.weekly_usage = [0] * (144 * 7)
+
+        self.stale = True
+
+    @classmethod
+    def from_collection(cls, collection):
+        volta_meter = cls()
+        volta_meter.weekly_usage = collection['weekly_usage']
+
+        volta_meter.in_use_charging_stats.cnt = collection['in_use_charging_stats']['cnt']
+        volta_meter.in_use_charging_stats.avg = collection['in_use_charging_stats']['avg']
+
+        volta_meter.in_use_stopped_stats.cnt = collection['in_use_stopped_stats']['cnt']
+        volta_meter.in_use_stopped_stats.avg = collection['in_use_stopped_stats']['avg']
+
+        return volta_meter
+
+    def update(self, new_state, new_availability, timezone):
+        if not self.is_valid(self.state, self.availability):
+            if not self.is_idle(new_state, new_availability):
+                return
+        else:
+            utc_time = DatetimeWithNanoseconds.utcnow()
+
+            self.update_in_use_charging(new_state, new_availability, utc_time)
+            self.update_in_use_stopped(new_state, new_availability, utc_time)
+            self.update_weekly_usage(new_state, new_availability, self.utc_to_local_time(utc_time, timezone))
+
+        if new_state != self.state:
+            logging.debug("updating meter state from {} to {}".format(self.state, new_state))
+            self.state = new_state
+            self.stale = True
+        if new_availability != self.availability:
+            logging.debug("updating meter availability from {} to {}".format(self.availability, new_availability))
+            self.availability = new_availability
+            self.stale = True
+
+    def update_in_use_charging(self, new_state, new_availability, utc_time):
+        if not self.is_in_use(self.state, self.availability) and self.is_in_use(new_state, new_availability):
+            logging.debug("updating meter in_use_charging_stats.start")
+            self.in_use_charging_stats.start = utc_time
+        elif self.is_in_use(self.state, self.availability) and not self.is_in_use(new_state, new_availability):
+            if self.in_use_charging_stats.start is not None:
+                logging.debug("updating meter in_use_charging_stats.avg")
+                self.in_use_charging_stats.update_avg(utc_time)
+            else:
+                log_warning("in use charge start time is None when it should not be", self.serialize())
+
+    def update_in_use_stopped(self, new_state, new_availability, utc_time):
+        if not self.is_in_use_stopped(self.state, self.availability) and self.is_in_use_stopped(new_state, new_availability):
+            logging.debug("updating meter in_use_stopped_stats.start")
+            self.in_use_stopped_stats.start = utc_time
+        elif self.is_in_use_stopped(self.state, self.availability) and not self.is_in_use_stopped(new_state, new_availability):
+            if self.in_use_stopped_stats.start is not None:
+                logging.debug("updating meter in_use_stopped_stats.avg")
+                self.in_use_stopped_stats.update_avg(utc_time)
+            else:
+                log_warning("in use idle start time is None when it should not be", self.serialize())
+
+    def update_weekly_usage(self, new_state, new_availability, local_time):
+        new_weekly_usage_update = (144 * local_time.weekday()) + (((local_time.hour * 60) + local_time.minute) // 10)
+        if self.is_in_use(new_state, new_availability) and new_weekly_usage_update != self.weekly_usage_update:
+            logging.debug("updating meter weekly_usage")
+            self.weekly_usage[new_weekly_usage_update] += 1
+            self.weekly_usage_update = new_weekly_usage_update
+
+    def is_valid(self, state, availability):
+        return state is not None and availability is not None
+    
+    def is_idle(self, state, availability):
+        return state in self.idle_states and availability in self.idle_availabilities
+
+    def is_in_use_charging(self, state, availability):
+        return state in self.in_use_charging_states and availability in self.in_use_charging_availabilities
+
+    def is_in_use_stopped(self, state, availability):
+        return state in self.in_use_stopped_states and availability in self.in_use_stopped_availabilities
+
+    def is_in_use(self, state, availability):
+        return self.is_in_use_charging(state, availability) or self.is_in_use_stopped(state, availability)
+
+    def utc_to_local_time(self, utc_time, timezone):
+        return timezone.fromutc(utc_time) if timezone is not None else utc_time
+
+    def serialize(self):
+        return {
+            'state': self.state,
+            'availability': self.availability,
+            'in_use_charging_stats': self.in_use_charging_stats.serialize(),
+            'in_use_stopped_stats': self.in_use_stopped_stats.serialize(),
+            'weekly_usage': self.weekly_usage
+        }
@@ -0,0 +1,61 @@
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.legacy import LegacyVoltaMeter
+from benchmarks.payloads import churn
+from volta_plus.models import MeterStore, VoltaMeter
+
+
+def allocate(factory, n_meters):
+    gc.collect()
+    tracemalloc.start()
+    meters = factory(n_meters)
+    nbytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return meters, nbytes
+
+
+def run_updates(meters, rounds):
+    start = time.perf_counter()
+    updates = 0
+    for states in rounds:
+        for volta_meter, (state, availability) in zip(meters, states):
+            volta_meter.update(state, availability, None)
+            volta_meter.stale = False
+        updates += len(states)
+    return updates / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    rounds = list(churn(args.meters, args.rounds))
+
+    def legacy_factory(n_meters):
+        return [LegacyVoltaMeter() for _ in range(n_meters)]
+
+    def store_factory(n_meters):
+        store = MeterStore()
+        return [VoltaMeter(store) for _ in range(n_meters)]
+
+    results = dict()
+    for name, factory in (('legacy', legacy_factory), ('meter_store', store_factory)):
+        meters, nbytes = allocate(factory, args.meters)
+        results[name] = {
+            'meters': args.meters,
+            'bytes': nbytes,
+            'bytes_per_meter': nbytes / args.meters,
+            'updates_per_sec': run_updates(meters, rounds)
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import json
+import time
+
+import pytz
+
+from benchmarks.legacy import LegacyVoltaMeter
+from benchmarks.payloads import churn
+from volta_plus.models import MeterStore, VoltaMeter
+
+
+def per_update_ns(meters, rounds, update):
+    start = time.perf_counter()
+    updates = 0
+    for states in rounds:
+        for volta_meter, (state, availability) in zip(meters, states):
+            update(volta_meter, state, availability)
+        updates += len(states)
+    return 1e9 * (time.perf_counter() - start) / updates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0.1, help="fraction of meters changing state per round")
+    args = parser.parse_args()
+
+    timezone = pytz.timezone('America/Los_Angeles')
+    rounds = list(churn(args.meters, args.rounds, args.rate))
+
+    def legacy_update(volta_meter, state, availability):
+        volta_meter.update(state, availability, timezone)
+
+    store = MeterStore()
+
+    def table_update(volta_meter, state, availability):
+        volta_meter.update(state, availability, timezone, store.codes(state, availability))
+
+    results = {
+        'legacy': per_update_ns([LegacyVoltaMeter() for _ in range(args.meters)], rounds, legacy_update),
+        'transition_table': per_update_ns([VoltaMeter(store) for _ in range(args.meters)], rounds, table_update)
+    }
+
+    print(json.dumps({'meters': args.meters, 'rate': args.rate, 'ns_per_update': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
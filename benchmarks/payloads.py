@@ -0,0 +1,78 @@
+import json
+import random
+
+
+METER_STATES = [
+    ('idle', 'available'),
+    ('pluggedout', 'available'),
+    ('charging', 'in use'),
+    ('pluggedin', 'plugged in...'),
+    ('chargestopped', 'in use'),
+]
+
+
+def churn(n_meters, rounds, rate=0.1, seed=0):
+    rng = random.Random(seed)
+    states = [METER_STATES[0]] * n_meters
+    for _ in range(rounds):
+        for i in rng.sample(range(n_meters), int(n_meters * rate)):
+            states[i] = rng.choice(METER_STATES)
+        yield list(states)
+
+
+def generate_sites(n_meters, meters_per_station=2, stations_per_site=4, seed=0):
+    rng = random.Random(seed)
+
+    sites = list()
+    n_stations = -(-n_meters // meters_per_station)
+    for station_index in range(n_stations):
+        site_index = station_index // stations_per_site
+        if station_index % stations_per_site == 0:
+            lng = rng.uniform(-123, -71)
+            lat = rng.uniform(26, 48)
+            sites.append({
+                'id': 'site-{}'.format(site_index),
+                'name': 'Site {}'.format(site_index),
+                'street_address': '{} Main St'.format(site_index),
+                'city': 'City {}'.format(site_index % 500),
+                'state': 'State {}'.format(site_index % 50),
+                'zip_code': '{:05d}'.format(site_index % 100000),
+                'location': {'type': 'Point', 'coordinates': [lng, lat]},
+                'stations': list()
+            })
+
+        site = sites[-1]
+        first_meter = station_index * meters_per_station
+        site['stations'].append({
+            'id': 'station-{}'.format(station_index),
+            'name': 'Station {}'.format(station_index),
+            'status': 'active',
+            'street_address': site['street_address'],
+            'city': site['city'],
+            'state': site['state'],
+            'zip_code': site['zip_code'],
+            'location': site['location'],
+            'meters': [
+                {'oem_id': 'meter-{}'.format(i), 'state': 'idle', 'availability': 'available'}
+                for i in range(first_meter, min(first_meter + meters_per_station, n_meters))
+            ]
+        })
+
+    return sites
+
+
+def iter_meters(sites):
+    for site in sites:
+        for station in site['stations']:
+            for meter in station['meters']:
+                yield meter
+
+
+def generate_payloads(n_meters, cycles, rate=0.05, seed=0, **kwargs):
+    sites = generate_sites(n_meters, seed=seed, **kwargs)
+    meters = list(iter_meters(sites))
+    for states in churn(len(meters), cycles, rate, seed):
+        for meter, (state, availability) in zip(meters, states):
+            meter['state'] = state
+            meter['availability'] = availability
+        yield json.dumps(sites).encode()
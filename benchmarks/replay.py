@@ -0,0 +1,173 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.payloads import generate_payloads
+from volta_plus.fetch import ApiFetcher
+from volta_plus.models import VoltaNetwork
+from volta_plus.storage import MemoryStorage
+
+
+# payloads are stored back to back, each prefixed with its length so the exact bytes replay
+HEADER = struct.Struct('>Q')
+
+
+def write_payloads(path, payloads):
+    cnt = 0
+    with open(path, 'wb') as f:
+        for payload in payloads:
+            f.write(HEADER.pack(len(payload)))
+            f.write(payload)
+            cnt += 1
+    return cnt
+
+
+def read_payloads(path):
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if not header:
+                return
+            yield f.read(HEADER.unpack(header)[0])
+
+
+def fetch_payloads(api_url, cycles, interval):
+    fetcher = ApiFetcher(api_url)
+    for i in range(cycles):
+        if i:
+            time.sleep(interval)
+        payload = fetcher.fetch()
+        if payload is not None:
+            yield payload
+
+
+def replay(path, poor=True, stream=False):
+    volta_network = VoltaNetwork(poor=poor, stream=stream, storage=MemoryStorage())
+
+    cycles = list()
+    for payload in read_payloads(path):
+        cycle = dict()
+
+        start = time.perf_counter()
+        if stream:
+            volta_network.parse(payload)
+        else:
+            sites = json.loads(payload.decode())
+            cycle['decode'] = time.perf_counter() - start
+            start = time.perf_counter()
+            volta_network.parse_sites(sites)
+        cycle['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        volta_network.persist()
+        cycle['persist'] = time.perf_counter() - start
+
+        cycle['writes'] = volta_network.write_buffer.docs_written
+        cycle['sites_skipped'] = volta_network.sites_skipped
+        cycles.append(cycle)
+
+    return cycles
+
+
+def replay_allocations(path, poor=True, stream=False):
+    volta_network = VoltaNetwork(poor=poor, stream=stream, storage=MemoryStorage())
+
+    cycles = list()
+    tracemalloc.start()
+    try:
+        for payload in read_payloads(path):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            volta_network.parse(payload)
+            volta_network.persist()
+            after, peak = tracemalloc.get_traced_memory()
+            cycles.append({'peak_bytes': peak - before, 'retained_bytes': after - before})
+    finally:
+        tracemalloc.stop()
+
+    return cycles
+
+
+def summarize(cycles, allocations):
+    # the first cycle creates every document, the rest show the steady state
+    summary = {'cycles': len(cycles), 'cold': dict(cycles[0], **allocations[0])}
+
+    steady = cycles[1:]
+    if steady:
+        total = sum(cycle.get('decode', 0) + cycle['parse'] + cycle['persist'] for cycle in steady)
+        summary['steady'] = {
+            'cycles_per_sec': len(steady) / total,
+            'stages': {
+                stage: sum(cycle[stage] for cycle in steady) / len(steady)
+                for stage in ('decode', 'parse', 'persist') if stage in steady[0]
+            },
+            'writes_per_cycle': sum(cycle['writes'] for cycle in steady) / len(steady),
+            'sites_skipped_per_cycle': sum(cycle['sites_skipped'] for cycle in steady) / len(steady),
+            'peak_bytes_per_cycle': max(allocation['peak_bytes'] for allocation in allocations[1:]),
+            'retained_bytes_per_cycle': sum(allocation['retained_bytes'] for allocation in allocations[1:]) / len(steady)
+        }
+
+    return summary
+
+
+def run(path, poor, stream):
+    return summarize(replay(path, poor, stream), replay_allocations(path, poor, stream))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help="write payloads to a file for replaying")
+    record.add_argument('path')
+    record.add_argument('--meters', type=int, default=1000)
+    record.add_argument('--cycles', type=int, default=10)
+    record.add_argument('--rate', type=float, default=0.05, help="fraction of meters changing state per cycle")
+    record.add_argument('--api-url', default=None, help="record the live endpoint instead of generating payloads")
+    record.add_argument('--interval', type=float, default=15)
+
+    replay_parser = subparsers.add_parser('replay', help="replay a recorded file")
+    replay_parser.add_argument('path')
+
+    suite = subparsers.add_parser('suite', help="generate and replay payloads at several network sizes")
+    suite.add_argument('--meters', default='100,1000,10000,50000')
+    suite.add_argument('--cycles', type=int, default=5)
+    suite.add_argument('--rate', type=float, default=0.05)
+
+    for subparser in (replay_parser, suite):
+        subparser.add_argument('--full', action='store_true', help="replay in full mode instead of poor mode")
+        subparser.add_argument('--stream', action='store_true', help="decode payloads one site at a time")
+
+    args = parser.parse_args()
+
+    # the per site warnings would dominate the timings
+    logging.disable(logging.WARNING)
+
+    if args.command == 'record':
+        if args.api_url is not None:
+            payloads = fetch_payloads(args.api_url, args.cycles, args.interval)
+        else:
+            payloads = generate_payloads(args.meters, args.cycles, args.rate)
+        print(json.dumps({'path': args.path, 'payloads': write_payloads(args.path, payloads)}, indent=2))
+
+    elif args.command == 'replay':
+        print(json.dumps(run(args.path, not args.full, args.stream), indent=2))
+
+    else:
+        report = {'cycles': args.cycles, 'rate': args.rate, 'poor': not args.full, 'stream': args.stream, 'results': dict()}
+        with tempfile.TemporaryDirectory() as directory:
+            for n_meters in (int(n) for n in args.meters.split(',')):
+                path = os.path.join(directory, '{}.payloads'.format(n_meters))
+                write_payloads(path, generate_payloads(n_meters, args.cycles, args.rate))
+                report['results'][n_meters] = run(path, not args.full, args.stream)
+
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
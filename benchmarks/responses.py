@@ -0,0 +1,87 @@
+import argparse
+import gzip
+import json
+import logging
+import time
+
+from flask import Flask, jsonify
+
+from benchmarks.payloads import generate_payloads
+from volta_plus import create_app, meter_response, reshape_meter
+from volta_plus.models import VoltaNetwork
+from volta_plus.responses import brotli, dumps, orjson
+from volta_plus.storage import MemoryStorage
+
+
+def measure(requests, send):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    transferred = 0
+    for _ in range(requests):
+        transferred += send()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    return {
+        'requests_per_sec': requests / wall,
+        'cpu_ms_per_request': 1000 * cpu / requests,
+        'bytes_per_response': transferred / requests,
+        'payload_bytes_per_sec': transferred / wall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--meter-ids', type=int, default=20, help="meters per /meters request")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    storage = MemoryStorage()
+    volta_network = VoltaNetwork(poor=True, storage=storage)
+    for payload in generate_payloads(args.meters, 2, rate=0.3):
+        volta_network.parse(payload)
+        volta_network.persist()
+
+    client = create_app(storage=storage).test_client()
+    payload = client.get('/sites').get_data()
+
+    report = {
+        'meters': args.meters,
+        'encoder': 'orjson' if orjson is not None else 'json',
+        'brotli': brotli is not None,
+        'sites': dict()
+    }
+
+    def sites(accept_encoding):
+        def send():
+            return len(client.get('/sites', headers={'Accept-Encoding': accept_encoding}).get_data())
+        return send
+
+    report['sites']['identity'] = measure(args.requests, sites('identity'))
+    report['sites']['precompressed_gzip'] = measure(args.requests, sites('gzip'))
+    if brotli is not None:
+        report['sites']['precompressed_br'] = measure(args.requests, sites('br'))
+
+    # what compressing in the request path, as a compression middleware would, costs instead
+    def per_request_gzip():
+        return len(gzip.compress(client.get('/sites', headers={'Accept-Encoding': 'identity'}).get_data(), 6))
+    report['sites']['per_request_gzip'] = measure(max(1, args.requests // 10), per_request_gzip)
+
+    # meter documents as served, with InUseStats datetimes, encoded the old and the new way
+    meter_ids = ['meter-{}'.format(i) for i in range(args.meter_ids)]
+    meters = [meter_response(reshape_meter(meter)) for meter in storage.get_many('meters', meter_ids).values()]
+    app = Flask(__name__)
+    with app.app_context():
+        report['meter_responses'] = {
+            'jsonify': measure(args.requests * 10, lambda: len(jsonify(meters).get_data())),
+            'dumps': measure(args.requests * 10, lambda: len(dumps(meters)))
+        }
+
+    report['sites_payload_bytes'] = len(payload)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
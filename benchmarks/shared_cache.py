@@ -0,0 +1,102 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.payloads import generate_payloads
+from volta_plus import create_app
+from volta_plus.models import VoltaNetwork
+from volta_plus.storage import SQLiteStorage
+
+
+class SlowStorage(SQLiteStorage):
+    # stands in for a remote store, every read pays a round trip
+    def __init__(self, path, latency):
+        super().__init__(path)
+        self.latency = latency
+        self.reads = 0
+
+    def get_many(self, collection, doc_ids, field_paths=None):
+        self.reads += 1
+        time.sleep(self.latency)
+        return super().get_many(collection, doc_ids, field_paths)
+
+
+def percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def run_worker(db_path, latency, ttl, shared_cache_dir, start_at, duration, results):
+    logging.disable(logging.WARNING)
+
+    storage = SlowStorage(db_path, latency)
+    app = create_app(storage=storage, sites_index_ttl=ttl, shared_cache_dir=shared_cache_dir)
+    client = app.test_client()
+
+    time.sleep(max(0, start_at - time.time()))
+    latencies = list()
+    end = time.time() + duration
+    while time.time() < end:
+        start = time.perf_counter()
+        response = client.get('/sites')
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+
+    results.put({'latencies': latencies, 'reads': storage.reads})
+
+
+def measure(db_path, args, shared_cache_dir):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+
+    # workers start together once they've all imported and built their app
+    start_at = time.time() + 5
+    workers = [
+        ctx.Process(target=run_worker, args=(db_path, args.latency, args.ttl, shared_cache_dir, start_at, args.duration, results))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    latencies = sorted(latency for report in reports for latency in report['latencies'])
+    return {
+        'requests_per_sec': len(latencies) / args.duration,
+        'p50_ms': 1000 * percentile(latencies, 0.5),
+        'p99_ms': 1000 * percentile(latencies, 0.99),
+        'max_ms': 1000 * latencies[-1],
+        'storage_reads': sum(report['reads'] for report in reports)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--ttl', type=float, default=1, help="sites index ttl, short to make refreshes frequent")
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated storage round trip in seconds")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    report = {'meters': args.meters, 'workers': args.workers, 'ttl': args.ttl, 'latency': args.latency}
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'volta_plus.db')
+        volta_network = VoltaNetwork(poor=True, storage=SQLiteStorage(db_path))
+        volta_network.parse(next(generate_payloads(args.meters, 1)))
+        volta_network.persist()
+
+        report['per_process'] = measure(db_path, args, None)
+        report['shared'] = measure(db_path, args, os.path.join(directory, 'shared'))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.payloads import generate_payloads
+from volta_plus.models import VoltaNetwork
+from volta_plus.snapshot import write_snapshot
+from volta_plus.storage import SQLiteStorage
+
+
+def first_cycle(volta_network, payload):
+    # what the restarted poller's first update costs on top of getting its state back
+    start = time.perf_counter()
+    volta_network.parse(payload)
+    volta_network.persist()
+    return {'seconds': time.perf_counter() - start, 'writes': volta_network.write_buffer.docs_written}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=20000)
+    parser.add_argument('--cycles', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    payloads = list(generate_payloads(args.meters, args.cycles + 1, rate=0.3))
+    report = {'meters': args.meters}
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, 'volta_plus.db'))
+        snapshot_path = os.path.join(directory, 'volta_plus.snapshot')
+
+        volta_network = VoltaNetwork(poor=True, storage=storage)
+        for payload in payloads[:-1]:
+            volta_network.parse(payload)
+            volta_network.persist()
+
+        start = time.perf_counter()
+        header, arrays = volta_network.capture()
+        report['capture_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report['snapshot_bytes'] = write_snapshot(snapshot_path, header, arrays)
+        report['write_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        restored = VoltaNetwork(poor=True, storage=storage, snapshot_path=snapshot_path)
+        report['restore_seconds'] = time.perf_counter() - start
+
+        store = volta_network.meter_store
+        restored_store = restored.meter_store
+        report['restored_identical'] = bool(
+            all(getattr(store, name) == getattr(restored_store, name) for name in store.columns) and
+            np.array_equal(store.weekly_usage[:store.size], restored_store.weekly_usage[:restored_store.size]) and
+            [start is None for start in store.stats_start] == [start is None for start in restored_store.stats_start]
+        )
+
+        start = time.perf_counter()
+        preloaded = VoltaNetwork(poor=True, storage=storage, preload=True)
+        report['preload_seconds'] = time.perf_counter() - start
+
+        report['first_cycle'] = {
+            'snapshot': first_cycle(restored, payloads[-1]),
+            'preload': first_cycle(preloaded, payloads[-1]),
+            'running': first_cycle(volta_network, payloads[-1])
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from volta_plus.models import MeterStore, VoltaMeter, WriteBuffer
+from volta_plus.storage import create_storage
+
+
+def generate_meters(n_meters, seed=0):
+    rng = random.Random(seed)
+    store = MeterStore()
+
+    meters = dict()
+    for i in range(n_meters):
+        volta_meter = VoltaMeter(store)
+        volta_meter.weekly_usage = [rng.randrange(50) for _ in range(MeterStore.weekly_usage_buckets)]
+        volta_meter.in_use_charging_stats.start = DatetimeWithNanoseconds.utcnow() if rng.random() < 0.2 else None
+        meters['meter-{}'.format(i)] = volta_meter.serialize()
+    return meters
+
+
+def measure(storage, meters, batch_size):
+    report = dict()
+    meter_ids = list(meters)
+
+    write_buffer = WriteBuffer(storage)
+    start = time.perf_counter()
+    for meter_id, data in meters.items():
+        write_buffer.set('meters', meter_id, data)
+    write_buffer.flush()
+    report['put_docs_per_sec'] = len(meters) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(meter_ids), batch_size):
+        storage.get_many('meters', meter_ids[i:(i + batch_size)])
+    report['get_many_docs_per_sec'] = len(meters) / (time.perf_counter() - start)
+
+    sample = meter_ids[:1000]
+    start = time.perf_counter()
+    for meter_id in sample:
+        storage.get('meters', meter_id, VoltaMeter.field_paths)
+    report['get_docs_per_sec'] = len(sample) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    streamed = sum(1 for _ in storage.stream('meters', VoltaMeter.field_paths))
+    report['stream_docs_per_sec'] = streamed / (time.perf_counter() - start)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--backends', default='memory,sqlite',
+                        help="comma separated backends to compare, firestore writes to the configured project")
+    args = parser.parse_args()
+
+    meters = generate_meters(args.meters)
+
+    report = {'meters': args.meters}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends.split(','):
+            if backend == 'sqlite':
+                storage = create_storage('sqlite:///{}'.format(os.path.join(directory, 'volta_plus.db')))
+            else:
+                storage = create_storage(backend)
+            try:
+                report[backend] = measure(storage, meters, args.batch_size)
+            finally:
+                storage.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
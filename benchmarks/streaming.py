@@ -0,0 +1,76 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.payloads import generate_payloads
+from volta_plus.streaming import iter_array
+
+
+def decode_whole(f):
+    return iter(json.loads(f.read().decode()))
+
+
+def decode_streaming(f):
+    return iter_array(f)
+
+
+def timed(path, decode):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        sites = decode(f)
+        next(sites)
+        first_site = time.perf_counter() - start
+        n_sites = 1 + sum(1 for _ in sites)
+    return n_sites, first_site, time.perf_counter() - start
+
+
+def measure(path, decode, results):
+    n_sites, first_site, total = timed(path, decode)
+
+    # ru_maxrss is a high water mark the imports already set, tracing counts only what decoding allocates,
+    # in a second pass since tracing slows it down
+    tracemalloc.start()
+    timed(path, decode)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results.put({
+        'sites': n_sites,
+        'time_to_first_site': first_site,
+        'total_time': total,
+        'peak_traced_bytes': peak
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meters', type=int, default=200000)
+    args = parser.parse_args()
+
+    payload = next(generate_payloads(args.meters, 1))
+    fd, path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        del payload
+
+        ctx = multiprocessing.get_context('spawn')
+        report = {'meters': args.meters, 'payload_bytes': os.path.getsize(path)}
+        for name, decode in (('json_loads', decode_whole), ('streaming', decode_streaming)):
+            results = ctx.Queue()
+            process = ctx.Process(target=measure, args=(path, decode, results))
+            process.start()
+            report[name] = results.get()
+            process.join()
+    finally:
+        os.remove(path)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import queue
+
+import pytest
+
+from volta_plus.events import ChangeBus, StorageChangeBus
+from volta_plus.storage import MemoryStorage
+
+
+def test_delivers_only_subscribed_meters():
+    change_bus = ChangeBus()
+    with change_bus.subscribe(['a']) as subscription:
+        change_bus.publish('b', {'state': 'idle'})
+        change_bus.publish('a', {'state': 'charging'})
+        assert subscription.get(timeout=1) == ('a', {'state': 'charging'})
+        assert subscription.events.empty()
+
+    assert change_bus.published == 2
+    assert change_bus.delivered == 1
+
+
+def test_listeners_see_every_change():
+    change_bus = ChangeBus()
+    seen = list()
+    change_bus.add_listener(lambda meter_id, meter: seen.append(meter_id))
+    change_bus.publish('a', {})
+    change_bus.publish('b', {})
+    assert seen == ['a', 'b']
+
+
+def test_slow_subscriber_drops_oldest_events():
+    change_bus = ChangeBus()
+    subscription = change_bus.subscribe(['a'])
+    for i in range(subscription.events.maxsize + 2):
+        change_bus.publish('a', {'i': i})
+
+    assert subscription.dropped == 2
+    assert subscription.get(timeout=1) == ('a', {'i': 2})
+
+
+def test_unsubscribe_stops_delivery():
+    change_bus = ChangeBus()
+    subscription = change_bus.subscribe(['a'])
+    subscription.close()
+    change_bus.publish('a', {})
+    assert subscription.events.empty()
+    assert not change_bus.subscriptions
+
+
+def test_storage_change_bus_publishes_stored_meters():
+    storage = MemoryStorage()
+    change_bus = StorageChangeBus(storage)
+    subscription = change_bus.subscribe(['a'])
+
+    storage.put_many([('meters', 'a', {'state': 'charging'}), ('sites', 'a', {'name': 'site'})])
+    assert subscription.get(timeout=1) == ('a', {'state': 'charging'})
+    # only the meters collection is watched
+    with pytest.raises(queue.Empty):
+        subscription.get(timeout=0.1)
+
+    change_bus.close()
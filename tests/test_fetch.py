@@ -0,0 +1,118 @@
+import gzip
+import http.server
+import threading
+
+import pytest
+
+from volta_plus.fetch import ApiFetcher
+
+
+PAYLOAD = b'[{"id": "site-1", "stations": []}]'
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # one handler per connection, kept alive connections are served by the same one
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        self.respond()
+
+        # the server drops the connection without saying so, like an idle timeout between polls
+        if self.server.drop_connections:
+            self.close_connection = True
+
+    def respond(self):
+        if self.headers.get('If-None-Match', None) == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = PAYLOAD
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = list()
+    server.etag = '"v1"'
+    server.drop_connections = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher(server):
+    fetcher = ApiFetcher('http://127.0.0.1:{}/v1/public-sites'.format(server.server_port), timeout=5)
+    yield fetcher
+    fetcher.close()
+
+
+def test_fetch_decompresses_gzip(server, fetcher):
+    assert fetcher.fetch() == PAYLOAD
+    assert server.requests[0]['Accept-Encoding'] == 'gzip'
+    assert fetcher.bytes_transferred == len(gzip.compress(PAYLOAD))
+    assert not fetcher.not_modified
+
+
+def test_not_modified_short_circuits(server, fetcher):
+    assert fetcher.fetch() == PAYLOAD
+    assert fetcher.fetch() is None
+    assert fetcher.not_modified
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+
+    server.etag = '"v2"'
+    assert fetcher.fetch() == PAYLOAD
+    assert fetcher.etag == '"v2"'
+
+
+def test_open_yields_none_when_not_modified(fetcher):
+    fetcher.fetch()
+    with fetcher.open() as f:
+        assert f is None
+
+
+def test_connection_is_reused(server, fetcher):
+    for _ in range(3):
+        fetcher.fetch()
+    assert len(server.requests) == 3
+    assert server.connections == 1
+
+
+def test_reconnects_after_connection_is_dropped(server, fetcher):
+    server.drop_connections = True
+    assert fetcher.fetch() == PAYLOAD
+    assert fetcher.fetch() is None
+    assert fetcher.fetch() is None
+    assert server.connections == 3
+
+
+def test_partially_read_response_leaves_connection_usable(server, fetcher):
+    with fetcher.open() as f:
+        f.read(1)
+    # the rest was drained, so the etag was kept and the connection can take the next request
+    assert fetcher.etag == '"v1"'
+    assert fetcher.fetch() is None
+    assert server.connections == 1
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus.models import VoltaNetwork
+from volta_plus.storage import MemoryStorage
+
+
+@pytest.fixture
+def sites():
+    # four sites of four stations with two meters each
+    return generate_sites(32)
+
+
+@pytest.fixture
+def volta_network(sites):
+    volta_network = VoltaNetwork(storage=MemoryStorage())
+    volta_network.parse(json.dumps(sites).encode())
+    volta_network.persist()
+    return volta_network
+
+
+def test_unchanged_payload_is_skipped(volta_network, sites):
+    volta_network.parse(json.dumps(sites).encode())
+    volta_network.persist()
+    assert volta_network.sites_seen == 4
+    assert volta_network.sites_skipped == 4
+    assert volta_network.write_buffer.docs_written == 0
+
+
+def test_only_changed_sites_are_parsed(volta_network, sites):
+    sites[2]['stations'][0]['meters'][0]['state'] = 'pluggedout'
+    volta_network.parse(json.dumps(sites).encode())
+    volta_network.persist()
+    assert volta_network.sites_skipped == 3
+    assert volta_network.sites['site-2'].stations['station-8'].meters['meter-16'].state == 'pluggedout'
+
+
+def test_sites_in_use_are_never_skipped(volta_network, sites):
+    meter = sites[1]['stations'][0]['meters'][0]
+    meter['state'] = 'charging'
+    meter['availability'] = 'in use'
+    volta_network.parse(json.dumps(sites).encode())
+
+    # the payload stands still, but the charging meter's weekly_usage bucket still has to advance
+    volta_network.parse(json.dumps(sites).encode())
+    assert volta_network.sites_skipped == 3
+    assert 'site-1' not in volta_network.site_fingerprints
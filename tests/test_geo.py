@@ -0,0 +1,74 @@
+import random
+import time
+
+import pytest
+
+from volta_plus import create_app
+from volta_plus.geo import SpatialIndex, haversine
+from volta_plus.storage import MemoryStorage
+
+
+@pytest.fixture
+def locations():
+    rng = random.Random(0)
+    locations = [
+        {'id': str(i), 'coordinates': [rng.uniform(-180, 180), rng.uniform(-90, 90)]}
+        for i in range(2000)
+    ]
+    locations.append({'id': 'none', 'coordinates': None})
+    return locations
+
+
+@pytest.mark.parametrize('lng, lat, radius', [
+    (-122.4, 37.8, 100),
+    (0, 0, 500),
+    (10, 89.5, 300),
+    (0, 90, 1000),
+    (-170, -90, 2000),
+    (45, 60, 0)
+])
+def test_near_matches_every_distance(locations, lng, lat, radius):
+    spatial_index = SpatialIndex(locations, cell_size=1)
+    expected = sorted(
+        (haversine(lng, lat, *location['coordinates']), location['id'])
+        for location in locations
+        if location['coordinates'] is not None and haversine(lng, lat, *location['coordinates']) <= radius
+    )
+
+    found = spatial_index.near(lng, lat, radius)
+    assert [location['id'] for _, location in found] == [location_id for _, location_id in expected]
+    assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_near_a_pole_scans_occupied_cells(locations):
+    spatial_index = SpatialIndex(locations)
+    assert len(spatial_index) == 2000
+
+    start = time.perf_counter()
+    for _ in range(10):
+        spatial_index.near(0, 90, 100)
+    # the bounding box alone covers every longitude at 0.1 degree cells
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize('query', [
+    'lat=nan&lng=0',
+    'lat=0&lng=inf',
+    'lat=0&lng=0&radius=nan',
+    'lat=91&lng=0',
+    'lat=0&lng=-181',
+    'lat=0&lng=0&radius=-1',
+    'lat=0&lng=0&limit=0',
+    'lat=north&lng=0',
+    'lng=0'
+])
+def test_sites_near_rejects_invalid_queries(query):
+    client = create_app(storage=MemoryStorage()).test_client()
+    assert client.get('/sites/near?{}'.format(query)).status_code == 400
+
+
+def test_sites_near_at_a_pole():
+    client = create_app(storage=MemoryStorage()).test_client()
+    response = client.get('/sites/near?lat=90&lng=180&radius=100')
+    assert response.status_code == 200
+    assert response.get_json() == []
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+import os
+
+import numpy as np
+import pytest
+
+from volta_plus import history as history_module
+from volta_plus.history import HistoryLog, HistoryReader, rebuild_rollups
+
+
+START = datetime(2020, 1, 6, 8, 30, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {'now': START.timestamp()}
+    monkeypatch.setattr(history_module.time, 'time', lambda: clock['now'])
+    return clock
+
+
+def charge(history, clock, meter_id, start, seconds):
+    clock['now'] = start.timestamp() + seconds
+    history.record(meter_id, 1, 2, charging_start=start.replace(tzinfo=None))
+
+
+def by_start(buckets):
+    return {bucket['start']: bucket for bucket in buckets if bucket['sessions'] or bucket['charging_seconds']}
+
+
+def test_sessions_are_split_across_hours(tmp_path, clock):
+    history = HistoryLog(str(tmp_path))
+    # 08:30 to 10:15
+    charge(history, clock, 'a', START, 6300)
+    history.flush()
+
+    buckets = HistoryReader(str(tmp_path)).query('a', START.replace(hour=0, minute=0), START.replace(hour=12, minute=0), 'hour')
+    assert len(buckets) == 12
+    found = by_start(buckets)
+    assert {start: bucket['charging_seconds'] for start, bucket in found.items()} == {
+        '2020-01-06T08:00:00+00:00': 1800,
+        '2020-01-06T09:00:00+00:00': 3600,
+        '2020-01-06T10:00:00+00:00': 900
+    }
+    # a session counts once, in the hour it started
+    assert sum(bucket['sessions'] for bucket in buckets) == 1
+    assert found['2020-01-06T08:00:00+00:00']['sessions'] == 1
+
+
+def test_daily_rollups(tmp_path, clock):
+    history = HistoryLog(str(tmp_path))
+    charge(history, clock, 'a', START, 600)
+    charge(history, clock, 'a', START.replace(day=7), 1200)
+    charge(history, clock, 'b', START, 60)
+    history.flush()
+
+    reader = HistoryReader(str(tmp_path))
+    days = reader.query('a', START.replace(day=1, hour=0, minute=0), START.replace(day=8, hour=0, minute=0), 'day')
+    assert len(days) == 7
+    assert {start: bucket['charging_seconds'] for start, bucket in by_start(days).items()} == {
+        '2020-01-06T00:00:00+00:00': 600,
+        '2020-01-07T00:00:00+00:00': 1200
+    }
+    assert reader.query('unknown', START, START, 'day') is None
+
+
+def test_unchanged_status_is_not_logged(tmp_path, clock):
+    history = HistoryLog(str(tmp_path))
+    history.record('a', 1, 1)
+    assert history.transitions_logged == 0
+
+
+def test_rollups_grow_with_the_meters(tmp_path, clock):
+    history = HistoryLog(str(tmp_path), capacity=2)
+    for i in range(5):
+        charge(history, clock, str(i), START, 60 * (i + 1))
+    history.flush()
+
+    assert np.load(str(tmp_path / 'hourly-2020-01-06.npy')).shape[0] >= 5
+    reader = HistoryReader(str(tmp_path))
+    assert by_start(reader.query('4', START.replace(minute=0), START.replace(hour=9, minute=0), 'hour')) == {
+        '2020-01-06T08:00:00+00:00': {
+            'start': '2020-01-06T08:00:00+00:00',
+            'charging_seconds': 300,
+            'stopped_seconds': 0,
+            'sessions': 1
+        }
+    }
+
+
+def test_rebuild_from_session_logs(tmp_path, clock):
+    history = HistoryLog(str(tmp_path))
+    charge(history, clock, 'a', START, 6300)
+    charge(history, clock, 'b', START.replace(day=7), 120)
+    history.flush()
+    del history
+
+    hourly = np.load(str(tmp_path / 'hourly-2020-01-06.npy'))
+    daily = np.load(str(tmp_path / 'daily-2020-01.npy'))
+
+    # a record cut short by a crash is ignored
+    with open(str(tmp_path / 'sessions-2020-01-07.bin'), 'ab') as f:
+        f.write(b'\0' * 5)
+    rebuild_rollups(str(tmp_path))
+
+    assert np.array_equal(np.load(str(tmp_path / 'hourly-2020-01-06.npy')), hourly)
+    assert np.array_equal(np.load(str(tmp_path / 'daily-2020-01.npy')), daily)
+
+
+def test_reader_finds_meters_across_shards(tmp_path, clock):
+    for shard, meter_id in enumerate(('a', 'b')):
+        history = HistoryLog(os.path.join(str(tmp_path), 'shard-{}'.format(shard)))
+        charge(history, clock, meter_id, START, 60 * (shard + 1))
+        history.flush()
+
+    reader = HistoryReader(str(tmp_path))
+    end = START.replace(hour=9, minute=0)
+    assert by_start(reader.query('b', START.replace(minute=0), end, 'hour'))['2020-01-06T08:00:00+00:00']['charging_seconds'] == 120
+
+    # meters logged after the reader first looked are picked up
+    history = HistoryLog(os.path.join(str(tmp_path), 'shard-0'))
+    charge(history, clock, 'c', START, 180)
+    history.flush()
+    assert by_start(reader.query('c', START.replace(minute=0), end, 'hour'))['2020-01-06T08:00:00+00:00']['charging_seconds'] == 180
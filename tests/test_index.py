@@ -0,0 +1,129 @@
+import json
+
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus import create_app
+from volta_plus.index import SitesIndex, join_parts, serialize_sites
+from volta_plus.models import VoltaNetwork, WriteBuffer
+from volta_plus.storage import MemoryStorage
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+        # whether the stored index could be read right before each head was written
+        self.readable_before_head = list()
+
+    def put_many(self, writes):
+        if writes[0][0] == 'indexes' and self.get('indexes', 'sites') is not None:
+            self.readable_before_head.append(read_index(self) is not None)
+        if writes[0][0] in self.failing:
+            raise RuntimeError("rejected {} writes".format(len(writes)))
+        super().put_many(writes)
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    monkeypatch.setattr(SitesIndex, 'max_part_size', 1000)
+
+
+@pytest.fixture
+def storage():
+    return FlakyStorage()
+
+
+def network(storage, n_meters=40):
+    volta_network = VoltaNetwork(storage=storage)
+    volta_network.parse(json.dumps(generate_sites(n_meters)).encode())
+    volta_network.persist()
+    return volta_network
+
+
+def read_index(storage):
+    head = storage.get('indexes', 'sites')
+    return join_parts(head, storage.get_many('index_parts', head['payload'] + head['locations']))
+
+
+def test_parts_join_back_into_the_index(storage):
+    volta_network = network(storage)
+
+    head = storage.get('indexes', 'sites')
+    assert len(head['payload']) > 1 and len(head['locations']) > 1
+    assert all(len(storage.get('index_parts', part_id)['data']) <= 1000 for part_id in head['payload'])
+
+    index = read_index(storage)
+    assert index['payload'] == serialize_sites(volta_network.sites_index.entries.values())['payload']
+    assert index['etag'] == head['etag']
+    assert len(json.loads(index['locations'])) == 20
+
+
+def test_torn_parts_are_not_joined(storage):
+    network(storage)
+    head = storage.get('indexes', 'sites')
+    parts = storage.get_many('index_parts', head['payload'] + head['locations'])
+
+    newer = dict(parts)
+    newer[head['payload'][-1]] = dict(parts[head['payload'][-1]], etag='newer')
+    assert join_parts(head, newer) is None
+
+    missing = dict(parts)
+    del missing[head['locations'][0]]
+    assert join_parts(head, missing) is None
+
+
+def test_writer_starts_from_the_stored_generation(storage):
+    network(storage)
+    live = set(storage.get('indexes', 'sites')['payload'])
+
+    # a restarted writer must not write its first parts over the ones the stored head points at
+    sites_index = SitesIndex()
+    sites_index.entries['site-new'] = ('state', 'city', 'new', [])
+    sites_index.locations['site-new'] = []
+    write_buffer = WriteBuffer(storage)
+    sites_index.write(write_buffer)
+    assert not live & {doc_id for collection, doc_id in write_buffer.pending if collection == 'index_parts'}
+
+
+def test_generation_is_kept_until_its_head_is_written(storage):
+    volta_network = network(storage)
+    live = storage.get('indexes', 'sites')
+
+    storage.failing.add('index_parts')
+    volta_network.parse(json.dumps(generate_sites(60)).encode())
+    with pytest.raises(RuntimeError):
+        volta_network.persist()
+    assert storage.get('indexes', 'sites') == live
+
+    # the next index goes over the parts that never got a head, not over the ones the stored head points at
+    storage.failing.clear()
+    volta_network.parse(json.dumps(generate_sites(80)).encode())
+    volta_network.persist()
+    assert storage.readable_before_head == [True]
+    assert len(json.loads(read_index(storage)['locations'])) == 40
+
+
+def test_torn_index_keeps_serving_the_last_one(storage):
+    network(storage)
+    client = create_app(storage=storage, sites_index_ttl=0).test_client()
+    first = client.get('/sites')
+    assert first.status_code == 200
+
+    head = storage.get('indexes', 'sites')
+    part = storage.get('index_parts', head['payload'][0])
+    storage.put_many([('index_parts', head['payload'][0], dict(part, etag='newer'))])
+
+    again = client.get('/sites')
+    assert again.status_code == 200
+    assert again.data == first.data
+
+
+def test_torn_index_before_any_was_loaded(storage):
+    network(storage)
+    head = storage.get('indexes', 'sites')
+    storage.put_many([('index_parts', head['payload'][0], {'etag': 'newer', 'data': ''})])
+
+    client = create_app(storage=storage).test_client()
+    assert client.get('/sites').status_code == 503
+    assert client.get('/sites/near?lat=37&lng=-100').status_code == 200
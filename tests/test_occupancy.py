@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+import json
+import time
+
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus.models import MeterStore, VoltaMeter, VoltaNetwork
+from volta_plus.occupancy import WEEK_SECONDS, WEEKLY_USAGE_BUCKETS, OccupancyEngine, segment_sums
+from volta_plus.storage import MemoryStorage
+
+
+def test_rates_over_weeks_observed():
+    now = time.time()
+    usage = np.zeros((3, WEEKLY_USAGE_BUCKETS), dtype=np.uint16)
+    usage[:, 10] = [1, 50, 3]
+    # a year, a year, and a week but counted three times
+    first_seen = np.array([now - 52 * WEEK_SECONDS, now - 52 * WEEK_SECONDS, now - WEEK_SECONDS])
+
+    rates = OccupancyEngine.usage_rates(usage, first_seen, now)
+    assert rates[:, 10] == pytest.approx([1 / 52, 50 / 52, 1], rel=1e-6)
+    assert not rates[:, 11].any()
+
+
+def test_unknown_first_seen_counts_from_the_epoch():
+    now = time.time()
+    usage = np.zeros((1, WEEKLY_USAGE_BUCKETS), dtype=np.uint16)
+    usage[0, 10] = 2
+    first_seen = np.array([np.nan])
+
+    # without an epoch only the busiest bucket bounds the weeks observed
+    assert OccupancyEngine.usage_rates(usage, first_seen, now)[0, 10] == pytest.approx(1)
+    rates = OccupancyEngine.usage_rates(usage, first_seen, now, now - 20 * WEEK_SECONDS)
+    assert rates[0, 10] == pytest.approx(2 / 20, rel=1e-6)
+
+
+def test_segment_sums_skip_empty_segments():
+    values = np.arange(8, dtype=np.float64).reshape(4, 2)
+    sizes = np.array([1, 0, 3])
+    offsets = np.array([0, 1, 1])
+    assert segment_sums(values, offsets, sizes).tolist() == [[0, 1], [0, 0], [12, 15]]
+
+
+def legacy_document():
+    stats = {'start': None, 'cnt': 0, 'avg': 0.0}
+    return {
+        'weekly_usage': [0] * WEEKLY_USAGE_BUCKETS,
+        'in_use_charging_stats': dict(stats),
+        'in_use_stopped_stats': dict(stats)
+    }
+
+
+def test_legacy_meters_keep_first_seen_unknown():
+    store = MeterStore()
+    legacy = VoltaMeter.from_collection(legacy_document(), store)
+    assert legacy.first_seen is None
+    assert legacy.serialize()['first_seen'] is None
+
+    first_seen = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    tracked = VoltaMeter.from_collection(dict(legacy_document(), first_seen=first_seen), store)
+    assert tracked.first_seen == datetime(2020, 1, 1)
+
+    restored = MeterStore.from_arrays(store.strings, store.to_arrays())
+    assert VoltaMeter(restored, legacy.row).first_seen is None
+    assert VoltaMeter(restored, tracked.row).first_seen == datetime(2020, 1, 1)
+
+
+def test_new_meters_are_first_seen_now():
+    storage = MemoryStorage()
+    volta_network = VoltaNetwork(storage=storage)
+    volta_network.parse(json.dumps(generate_sites(2)).encode())
+    volta_network.persist()
+
+    first_seen = storage.get('meters', 'meter-0')['first_seen']
+    assert abs(first_seen - datetime.utcnow()) < timedelta(minutes=1)
+
+
+def test_engine_uses_the_network_epoch(monkeypatch):
+    storage = MemoryStorage()
+    weekly_usage = [0] * WEEKLY_USAGE_BUCKETS
+    weekly_usage[10] = 4
+    storage.put_many([('meters', 'meter-0', {'weekly_usage': weekly_usage, 'first_seen': None})])
+    locations = [{'site_id': 'site-0', 'station_id': 'station-0', 'timezone': None, 'meters': ['meter-0']}]
+
+    engine = OccupancyEngine(storage)
+    engine.rebuild(locations, 'a')
+    assert engine.rates[0, 10] == pytest.approx(1)
+
+    epoch = datetime.now(timezone.utc) - timedelta(weeks=8)
+    engine = OccupancyEngine(storage, network_epoch=epoch)
+    engine.rebuild(locations, 'a')
+    assert np.isnan(engine.first_seen[0])
+    assert engine.rates[0, 10] == pytest.approx(4 / 8, rel=1e-3)
+
+    weekly_usage[10] = 6
+    engine.update_meter('meter-0', weekly_usage)
+    assert engine.station_sums[0, 10] == pytest.approx(6 / 8, rel=1e-3)
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus.models import VoltaNetwork
+from volta_plus.storage import MemoryStorage
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get_many(self, collection, doc_ids, field_paths=None):
+        # the index writer looking up its generation doesn't count
+        if collection != 'indexes':
+            self.reads += 1
+        return super().get_many(collection, doc_ids, field_paths)
+
+
+def payload(sites):
+    return json.dumps(sites).encode()
+
+
+@pytest.fixture
+def sites():
+    # two sites of four stations with two meters each
+    return generate_sites(16)
+
+
+@pytest.fixture
+def storage(sites):
+    storage = CountingStorage()
+    volta_network = VoltaNetwork(storage=storage)
+    volta_network.parse(payload(sites))
+    volta_network.persist()
+
+    meter = storage.get('meters', 'meter-8')
+    meter['weekly_usage'][5] = 42
+    meter['in_use_charging_stats']['cnt'] = 7
+    storage.put_many([('meters', 'meter-8', meter)])
+
+    storage.reads = 0
+    return storage
+
+
+@pytest.mark.parametrize('poor', [False, True])
+def test_first_cycle_reads_nothing(storage, sites, poor):
+    if poor:
+        volta_network = VoltaNetwork(poor=True, storage=storage)
+        volta_network.parse(payload(sites))
+        volta_network.persist()
+        storage.reads = 0
+
+    volta_network = VoltaNetwork(poor=poor, preload=True, storage=storage)
+    assert volta_network.preloaded
+    volta_network.parse(payload(sites))
+    assert storage.reads == 0
+    assert volta_network.sites['site-1'].stations['station-4'].meters['meter-8'].weekly_usage[5] == 42
+
+
+def test_meter_back_after_first_cycle_keeps_its_history(storage, sites):
+    volta_network = VoltaNetwork(preload=True, storage=storage)
+    volta_network.parse(payload(sites[:1]))
+    volta_network.persist()
+    assert not volta_network.preloaded
+
+    volta_network.parse(payload(sites))
+    volta_network.persist()
+
+    meter = storage.get('meters', 'meter-8')
+    assert meter['weekly_usage'][5] == 42
+    assert meter['in_use_charging_stats']['cnt'] == 7
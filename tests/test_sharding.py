@@ -0,0 +1,63 @@
+import json
+import time
+
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus.sharding import ShardedNetwork, shard_of
+from volta_plus.storage import SQLiteStorage
+
+
+def test_shard_of_is_stable():
+    assert [shard_of('site-{}'.format(i), 3) for i in range(6)] == [
+        shard_of('site-{}'.format(i), 3) for i in range(6)
+    ]
+    assert {shard_of('site-{}'.format(i), 3) for i in range(100)} == {0, 1, 2}
+
+
+@pytest.fixture
+def sharded_network(tmp_path):
+    sharded_network = ShardedNetwork(
+        2,
+        storage_url='sqlite:///{}'.format(tmp_path / 'volta_plus.db'),
+        poor=True,
+        log_path=str(tmp_path / 'volta_plus.log'),
+        timeout=5
+    )
+    yield sharded_network
+    sharded_network.close()
+
+
+def test_dead_worker_is_restarted(tmp_path, sharded_network):
+    sites = generate_sites(80)
+    payload = json.dumps(sites).encode()
+
+    sharded_network.parse(payload)
+    sharded_network.persist()
+    storage = SQLiteStorage(str(tmp_path / 'volta_plus.db'))
+    assert len(list(storage.stream('meters'))) == 80
+
+    sharded_network.workers[0].kill()
+    sharded_network.workers[0].join()
+
+    # the dead worker's sites are given up on for the cycle, not waited on until the timeout
+    start = time.monotonic()
+    sharded_network.parse(payload)
+    assert time.monotonic() - start < 5
+    assert sharded_network.restarts == 1
+    assert all(worker.is_alive() for worker in sharded_network.workers)
+
+    sites[0]['stations'][0]['meters'][0]['state'] = 'charging'
+    sites[0]['stations'][0]['meters'][0]['availability'] = 'in use'
+    sharded_network.parse(json.dumps(sites).encode())
+    sharded_network.persist()
+    assert storage.get('meters', 'meter-0')['state'] == 'charging'
+    assert sharded_network.restarts == 1
+
+
+def test_workers_log_to_their_own_files(tmp_path, sharded_network):
+    sharded_network.parse(b'[{"name": "no id"}]')
+    sharded_network.close()
+
+    logs = sorted(path.name for path in tmp_path.glob('volta_plus*.log'))
+    assert logs == ['volta_plus.shard-0.log', 'volta_plus.shard-1.log']
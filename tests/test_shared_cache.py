@@ -0,0 +1,107 @@
+import gzip
+import json
+import mmap
+import threading
+import time
+
+import pytest
+
+from benchmarks.payloads import generate_sites
+from volta_plus import create_app
+from volta_plus.models import VoltaNetwork
+from volta_plus.shared_cache import SharedCache
+from volta_plus.storage import MemoryStorage
+
+
+@pytest.fixture
+def shared_cache(tmp_path):
+    return SharedCache(str(tmp_path / 'cache'))
+
+
+def test_fields_are_views_into_the_shared_file(shared_cache):
+    fields = shared_cache.get('sites', 60, lambda: [b'etag', b'payload'])
+    assert [bytes(field) for field in fields] == [b'etag', b'payload']
+    assert all(isinstance(field, memoryview) and isinstance(field.obj, mmap.mmap) for field in fields)
+    assert shared_cache.builds == 1
+
+    # another worker on the host maps the same file instead of building it again
+    other = SharedCache(shared_cache.directory)
+    assert [bytes(field) for field in other.get('sites', 60, lambda: [b'other'])] == [b'etag', b'payload']
+    assert other.builds == 0
+
+
+def test_views_outlive_the_entry_they_came_from(shared_cache):
+    old = shared_cache.get('sites', 0, lambda: [b'old'])
+    # the file is replaced, a response still writing out the old view keeps its mapping
+    shared_cache.store('sites', [b'new'], time.time() + 60)
+    assert bytes(shared_cache.get('sites', 60, lambda: [b'built'])[0]) == b'new'
+    assert bytes(old[0]) == b'old'
+
+
+def test_stale_entry_is_served_while_it_is_rebuilt(shared_cache):
+    shared_cache.get('sites', 0, lambda: [b'old'])
+    started = threading.Event()
+    release = threading.Event()
+
+    def build():
+        started.set()
+        release.wait(5)
+        return [b'new']
+
+    assert bytes(shared_cache.get('sites', 60, build)[0]) == b'old'
+    started.wait(5)
+    # only one rebuild at a time, everyone else keeps answering from the stale entry
+    assert bytes(SharedCache(shared_cache.directory).get('sites', 60, build)[0]) == b'old'
+    release.set()
+    for _ in range(100):
+        if shared_cache.builds == 2:
+            break
+        time.sleep(0.05)
+    assert bytes(shared_cache.get('sites', 60, build)[0]) == b'new'
+
+
+def test_a_build_with_nothing_keeps_the_entry(shared_cache):
+    assert shared_cache.get('sites', 60, lambda: None) is None
+    shared_cache.get('sites', 0, lambda: [b'old'])
+
+    built = threading.Event()
+
+    def build():
+        built.set()
+        return None
+
+    assert bytes(shared_cache.get('sites', 60, build)[0]) == b'old'
+    assert built.wait(5)
+    time.sleep(0.05)
+    assert shared_cache.builds == 1
+    assert bytes(SharedCache(shared_cache.directory).load('sites')[1][0]) == b'old'
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage()
+    volta_network = VoltaNetwork(storage=storage)
+    volta_network.parse(json.dumps(generate_sites(40)).encode())
+    volta_network.persist()
+    return storage
+
+
+def test_sites_served_from_the_shared_cache(tmp_path, storage):
+    expected = create_app(storage=storage).test_client().get('/sites')
+    client = create_app(storage=storage, shared_cache_dir=str(tmp_path / 'cache')).test_client()
+
+    response = client.get('/sites')
+    assert response.status_code == 200
+    assert response.data == expected.data
+    assert response.content_length == len(expected.data)
+    assert response.headers['ETag'] == expected.headers['ETag']
+
+    compressed = client.get('/sites', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == expected.data
+
+    not_modified = client.get('/sites', headers={'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+
+    near = client.get('/sites/near?lat=37&lng=-100&radius=100000')
+    assert near.status_code == 200
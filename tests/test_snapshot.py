@@ -0,0 +1,128 @@
+import json
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_payloads
+from volta_plus import snapshot as snapshot_module
+from volta_plus.models import VoltaNetwork
+from volta_plus.snapshot import SnapshotWriter, read_snapshot, write_snapshot
+from volta_plus.storage import MemoryStorage
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+    def put_many(self, writes):
+        if writes[0][0] in self.failing:
+            raise RuntimeError("rejected {} writes".format(len(writes)))
+        super().put_many(writes)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # both networks of a round trip read the same clock
+    now = DatetimeWithNanoseconds(2020, 1, 6, 8, 0, 0)
+    monkeypatch.setattr(DatetimeWithNanoseconds, 'utcnow', classmethod(lambda cls: now))
+
+
+@pytest.fixture
+def payloads():
+    return list(generate_payloads(64, 4, rate=0.3))
+
+
+@pytest.fixture
+def storage():
+    return FlakyStorage()
+
+
+def running_network(storage, payloads, poor=True):
+    volta_network = VoltaNetwork(poor=poor, storage=storage)
+    for payload in payloads:
+        volta_network.parse(payload)
+        volta_network.persist()
+    return volta_network
+
+
+def snapshot_to(volta_network, path):
+    header, arrays = volta_network.capture()
+    write_snapshot(str(path), header, arrays)
+
+
+@pytest.mark.parametrize('poor', [True, False])
+def test_restore_round_trip(tmp_path, storage, payloads, poor):
+    volta_network = running_network(storage, payloads[:-1], poor)
+    path = tmp_path / 'volta_plus.snapshot'
+    snapshot_to(volta_network, path)
+
+    restored = VoltaNetwork(poor=poor, storage=storage, snapshot_path=str(path))
+    store = volta_network.meter_store
+    restored_store = restored.meter_store
+    assert restored_store.size == store.size
+    for name in store.columns:
+        assert np.array_equal(np.array(getattr(restored_store, name)), np.array(getattr(store, name)), equal_nan=True)
+    assert np.array_equal(restored_store.weekly_usage[:store.size], store.weekly_usage[:store.size])
+    assert restored_store.stats_start == store.stats_start
+    assert restored.capture()[0]['sites'] == volta_network.capture()[0]['sites']
+
+    # the next cycle writes exactly what the network that never stopped writes
+    for network in (volta_network, restored):
+        network.parse(payloads[-1])
+        network.write_buffer.storage = MemoryStorage()
+        network.persist()
+    assert dict(restored.write_buffer.storage.stream('meters')) == dict(volta_network.write_buffer.storage.stream('meters'))
+
+
+def test_pending_writes_are_requeued(tmp_path, storage, payloads):
+    volta_network = running_network(storage, payloads[:1])
+    storage.failing.add('meters')
+    volta_network.parse(payloads[1])
+    with pytest.raises(RuntimeError):
+        volta_network.persist()
+    pending = volta_network.write_buffer.pending_keys()
+    assert pending
+
+    path = tmp_path / 'volta_plus.snapshot'
+    snapshot_to(volta_network, path)
+
+    storage.failing.clear()
+    restored = VoltaNetwork(poor=True, storage=storage, snapshot_path=str(path))
+    assert sorted(restored.write_buffer.pending) == sorted(tuple(key) for key in pending)
+    restored.persist()
+    for collection, doc_id in pending:
+        assert storage.get(collection, doc_id) == volta_network.write_buffer.pending[(collection, doc_id)]
+
+
+def test_mismatched_snapshots_are_ignored(tmp_path, storage, payloads, monkeypatch):
+    volta_network = running_network(storage, payloads[:1])
+    path = tmp_path / 'volta_plus.snapshot'
+    snapshot_to(volta_network, path)
+
+    # taken in poor mode, so a full network starts without it
+    restored = VoltaNetwork(storage=MemoryStorage(), snapshot_path=str(path))
+    assert not restored.sites
+    assert restored.meter_store.size == 0
+
+    monkeypatch.setattr(snapshot_module, 'SNAPSHOT_VERSION', snapshot_module.SNAPSHOT_VERSION + 1)
+    assert read_snapshot(str(path)) is None
+    assert read_snapshot(str(tmp_path / 'missing')) is None
+
+
+def test_writer_is_atomic_and_waits_its_interval(tmp_path, storage, payloads):
+    volta_network = running_network(storage, payloads[:1])
+    path = tmp_path / 'volta_plus.snapshot'
+    writer = SnapshotWriter(str(path), interval=3600)
+    assert not writer.due()
+
+    writer.interval = 0
+    assert writer.due()
+    header, arrays = volta_network.capture()
+    writer.submit(header, arrays, 0)
+    writer.close()
+
+    assert [p.name for p in tmp_path.iterdir()] == ['volta_plus.snapshot']
+    assert writer.size == path.stat().st_size
+    assert json.loads(json.dumps(read_snapshot(str(path))[0])) == json.loads(json.dumps(header))
@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+import multiprocessing
+
+import pytest
+
+from volta_plus.storage import MemoryStorage, SQLiteStorage, Storage, create_storage
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStorage()
+    return SQLiteStorage(str(tmp_path / 'volta_plus.db'))
+
+
+def test_round_trip(storage):
+    start = datetime(2020, 1, 6, 8, 0, tzinfo=timezone.utc)
+    storage.put_many([
+        ('meters', 'a', {'state': 'charging', 'in_use_charging_stats': {'start': start, 'cnt': 1}}),
+        ('meters', 'b', {'state': 'idle', 'in_use_charging_stats': {'start': None, 'cnt': 0}}),
+        ('sites', 'a', {'name': 'site'})
+    ])
+
+    assert storage.get('meters', 'a')['in_use_charging_stats']['start'] == start
+    assert storage.get('meters', 'c') is None
+    assert storage.get_many('meters', ['b', 'c'], ['state']) == {'b': {'state': 'idle'}}
+    assert sorted(doc_id for doc_id, _ in storage.stream('meters')) == ['a', 'b']
+
+    storage.put_many([('meters', 'a', {'state': 'idle'})])
+    assert storage.get('meters', 'a') == {'state': 'idle'}
+
+
+def test_documents_are_copied(storage):
+    doc = {'weekly_usage': [0, 0]}
+    storage.put_many([('meters', 'a', doc)])
+    doc['weekly_usage'][0] = 1
+    storage.get('meters', 'a')['weekly_usage'][1] = 1
+    assert storage.get('meters', 'a') == {'weekly_usage': [0, 0]}
+
+
+def test_create_storage(tmp_path):
+    assert isinstance(create_storage('memory'), MemoryStorage)
+    assert isinstance(create_storage('sqlite:///{}'.format(tmp_path / 'volta_plus.db')), SQLiteStorage)
+    with pytest.raises(ValueError):
+        create_storage('postgres://localhost')
+
+
+def write_rows(path, writer, rows, batch_size):
+    storage = SQLiteStorage(path)
+    for i in range(0, rows, batch_size):
+        storage.put_many([
+            ('meters', '{}-{}'.format(writer, j), {'v': j})
+            for j in range(i, min(i + batch_size, rows))
+        ])
+    storage.close()
+
+
+def test_concurrent_writers_get_distinct_sequence_numbers(tmp_path):
+    path = str(tmp_path / 'volta_plus.db')
+    SQLiteStorage(path).close()
+
+    ctx = multiprocessing.get_context('spawn')
+    writers = [ctx.Process(target=write_rows, args=(path, writer, 500, 10)) for writer in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+        assert writer.exitcode == 0
+
+    # a watch moves past every sequence number it has seen, a number handed out twice would hide a change
+    storage = SQLiteStorage(path)
+    seqs = [seq for _, _, seq in storage.changes('meters', 0)]
+    assert len(seqs) == 2000
+    assert len(set(seqs)) == 2000
+    assert storage.last_seq('meters') == max(seqs)
+
+
+def test_watch_sees_writes_from_another_connection(tmp_path):
+    path = str(tmp_path / 'volta_plus.db')
+    storage = SQLiteStorage(path, watch_interval=0.05)
+    seen = list()
+    watch = storage.watch('meters', lambda doc_id, doc: seen.append((doc_id, doc)))
+    try:
+        write_rows(path, 'other', 3, 2)
+        for _ in range(100):
+            if len(seen) == 3:
+                break
+            watch.stopped.wait(0.05)
+    finally:
+        watch.unsubscribe()
+    assert seen == [('other-0', {'v': 0}), ('other-1', {'v': 1}), ('other-2', {'v': 2})]
+
+
+def test_backends_must_implement_the_interface():
+    class Incomplete(Storage):
+        def get_many(self, collection, doc_ids, field_paths=None):
+            return dict()
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        Storage()
@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+from benchmarks.payloads import generate_payloads
+from volta_plus.streaming import iter_array
+
+
+PAYLOADS = [
+    '[]',
+    ' \n[ ] ',
+    '[1, 22, 333, -4.5e6, true, false, null]',
+    '["a]b", "c,d", "e\\"]", "\\u00e9"]',
+    '[{"id": "café € \U0001f600", "nested": [[1, 2], {"k": [3]}]}, {}]',
+    '[\n  {"id": "1"},\n  {"id": "2"}\n]\n'
+]
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 65536])
+def test_matches_json_loads(payload, chunk_size):
+    assert list(iter_array(io.BytesIO(payload.encode()), chunk_size)) == json.loads(payload)
+
+
+@pytest.mark.parametrize('chunk_size', [5, 4096])
+def test_matches_json_loads_on_sites_payload(chunk_size):
+    payload = next(generate_payloads(200, 1))
+    assert list(iter_array(io.BytesIO(payload), chunk_size)) == json.loads(payload)
+
+
+@pytest.mark.parametrize('payload', ['{"id": 1}', '[1, 2', '[1 2]', '[{"id": 1]', ''])
+def test_rejects_invalid_arrays(payload):
+    with pytest.raises(ValueError):
+        list(iter_array(io.BytesIO(payload.encode()), 2))
+
+
+def test_yields_before_the_end_is_read():
+    class Truncated(io.BytesIO):
+        def read(self, size=-1):
+            data = super().read(size)
+            if not data:
+                raise AssertionError("read past the first value")
+            return data
+
+    sites = iter_array(Truncated(b'[{"id": "1"}, {"id": "2"'), 4)
+    assert next(sites) == {'id': '1'}
@@ -0,0 +1,71 @@
+from datetime import timedelta
+import itertools
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+import pytest
+
+from benchmarks.legacy import LegacyVoltaMeter
+from volta_plus.models import MeterStore, VoltaMeter
+
+
+OBSERVATIONS = [
+    ('idle', 'available'),
+    ('pluggedout', 'available'),
+    ('charging', 'in use'),
+    ('pluggedin', 'plugged in...'),
+    ('chargestopped', 'in use'),
+    ('charging', 'available'),
+    ('unknown', 'in use'),
+    (None, None)
+]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # both meters read the same clock, it's advanced by a ten minute bucket between updates
+    clock = {'now': DatetimeWithNanoseconds(2020, 1, 6, 8, 0, 0)}
+    monkeypatch.setattr(DatetimeWithNanoseconds, 'utcnow', classmethod(lambda cls: clock['now']))
+    return clock
+
+
+def serialize(volta_meter):
+    data = volta_meter.serialize()
+    data.pop('first_seen', None)
+    data['weekly_usage'] = list(data['weekly_usage'])
+    return data
+
+
+@pytest.mark.parametrize('first', OBSERVATIONS)
+def test_matches_legacy_meter(clock, first):
+    for sequence in itertools.product(OBSERVATIONS, repeat=3):
+        volta_meter = VoltaMeter(MeterStore())
+        legacy_meter = LegacyVoltaMeter()
+        for state, availability in (first,) + sequence:
+            clock['now'] += timedelta(minutes=10)
+            volta_meter.update(state, availability, None)
+            legacy_meter.update(state, availability, None)
+
+            assert serialize(volta_meter) == serialize(legacy_meter), (first,) + sequence
+            assert volta_meter.stale == legacy_meter.stale
+
+
+def test_same_bucket_counts_once(clock):
+    volta_meter = VoltaMeter(MeterStore())
+    volta_meter.update('idle', 'available', None)
+    for _ in range(3):
+        clock['now'] += timedelta(minutes=1)
+        volta_meter.update('charging', 'in use', None)
+    assert volta_meter.weekly_usage.sum() == 1
+
+
+def test_update_reports_actions(clock):
+    volta_meter = VoltaMeter(MeterStore())
+    assert volta_meter.update('charging', 'in use', None) & VoltaMeter.IGNORE
+    assert not volta_meter.update('idle', 'available', None) & VoltaMeter.IGNORE
+
+    clock['now'] += timedelta(minutes=10)
+    assert volta_meter.update('charging', 'in use', None) & VoltaMeter.CHARGING_START
+    clock['now'] += timedelta(minutes=30)
+    assert volta_meter.update('idle', 'available', None) & VoltaMeter.CHARGING_END
+    assert volta_meter.in_use_charging_stats.cnt == 1
+    assert volta_meter.in_use_charging_stats.avg == 30 * 60
@@ -0,0 +1,116 @@
+import pytest
+
+from volta_plus.models import WriteBuffer
+from volta_plus.storage import MemoryStorage
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+        self.batches = list()
+        self.during_commit = None
+
+    def put_many(self, writes):
+        if self.during_commit is not None:
+            self.during_commit(writes)
+        if writes[0][0] in self.failing:
+            raise RuntimeError("rejected {} writes".format(len(writes)))
+        self.batches.append([(collection, doc_id) for collection, doc_id, _ in writes])
+        super().put_many(writes)
+
+
+@pytest.fixture
+def storage():
+    return FlakyStorage()
+
+
+def test_later_writes_replace_earlier_ones(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.set('meters', 'a', {'v': 1})
+    write_buffer.set('meters', 'a', {'v': 2})
+    assert len(write_buffer) == 1
+
+    write_buffer.flush()
+    assert storage.get('meters', 'a') == {'v': 2}
+    assert write_buffer.docs_written == 1
+    assert len(write_buffer) == 0
+
+
+def test_batches_per_collection(storage):
+    write_buffer = WriteBuffer(storage)
+    for i in range(WriteBuffer.max_batch_size + 1):
+        write_buffer.set('meters', str(i), {'v': i})
+    write_buffer.set('sites', 's', {'v': 0})
+
+    write_buffer.flush()
+    assert [len(batch) for batch in storage.batches] == [WriteBuffer.max_batch_size, 1, 1]
+    assert all(len({collection for collection, _ in batch}) == 1 for batch in storage.batches)
+    assert write_buffer.batches == 3
+
+
+def test_flush_with_nothing_queued(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.flush()
+    assert storage.batches == []
+    assert write_buffer.docs_written == 0
+
+
+def test_failed_batch_is_requeued_without_blocking_others(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.set('sites', 's', {'v': 0})
+    write_buffer.set('meters', 'a', {'v': 1})
+    storage.failing.add('sites')
+
+    with pytest.raises(RuntimeError):
+        write_buffer.flush()
+    assert storage.get('meters', 'a') == {'v': 1}
+    assert write_buffer.docs_written == 1
+    assert list(write_buffer.pending) == [('sites', 's')]
+
+    storage.failing.clear()
+    write_buffer.flush()
+    assert storage.get('sites', 's') == {'v': 0}
+    assert len(write_buffer) == 0
+
+
+def test_requeue_keeps_writes_queued_during_the_flush(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.set('meters', 'a', {'v': 1})
+    storage.failing.add('meters')
+    # parsing carries on while the flush commits, a newer write to the same document wins over the retry
+    storage.during_commit = lambda writes: write_buffer.set('meters', 'a', {'v': 2})
+
+    with pytest.raises(RuntimeError):
+        write_buffer.flush()
+    assert write_buffer.pending[('meters', 'a')] == {'v': 2}
+
+
+def test_index_head_waits_for_its_parts(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.set('indexes', 'sites', {'payload': ['part']})
+    write_buffer.set('index_parts', 'part', {'data': '[]'})
+    write_buffer.set('meters', 'a', {'v': 1})
+    storage.failing.add('index_parts')
+
+    with pytest.raises(RuntimeError):
+        write_buffer.flush()
+    assert storage.get('indexes', 'sites') is None
+    assert storage.get('meters', 'a') == {'v': 1}
+    assert set(write_buffer.pending) == {('indexes', 'sites'), ('index_parts', 'part')}
+
+    storage.failing.clear()
+    write_buffer.flush()
+    assert [batch[0][0] for batch in storage.batches[-2:]] == ['index_parts', 'indexes']
+
+
+def test_pending_keys_include_writes_being_flushed(storage):
+    write_buffer = WriteBuffer(storage)
+    write_buffer.set('meters', 'a', {'v': 1})
+    seen = list()
+    # a snapshot captured while a flush commits must still count its writes as pending
+    storage.during_commit = lambda writes: seen.extend(write_buffer.pending_keys())
+
+    write_buffer.flush()
+    assert seen == [('meters', 'a')]
+    assert write_buffer.pending_keys() == []
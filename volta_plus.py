@@ -1,26 +1,78 @@
+import argparse
 import logging
 from logging.handlers import TimedRotatingFileHandler
-import time
 
+from volta_plus.metrics import registry
 from volta_plus.models import VoltaNetwork
+from volta_plus.poller import Poller
+from volta_plus.sharding import ShardedNetwork
+from volta_plus.storage import create_storage
 
 
-logging.basicConfig(
-    level=logging.WARNING,
-    format='[%(levelname)s][%(asctime)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[TimedRotatingFileHandler('volta_plus.log', when='midnight', backupCount=3, utc=True)]
-)
+LOG_PATH = 'volta_plus.log'
 
 
 if __name__ == '__main__':
-    volta_network = VoltaNetwork(poor=True)
-
-    while True:
-        try:
-            volta_network.update()
-            logging.debug("updated Volta Network")
-            time.sleep(15)
-        except Exception as e:
-            logging.exception(e)
-            time.sleep(30)
+    # only here, shard workers are spawned and import this script again as __mp_main__
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='[%(levelname)s][%(asctime)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[TimedRotatingFileHandler(LOG_PATH, when='midnight', backupCount=3, utc=True)]
+    )
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--preload', action='store_true',
+                        help="read all stored documents at startup instead of one by one as they are first seen")
+    parser.add_argument('--timezone-cache', default='timezones.json',
+                        help="file the coordinates to timezone cache is persisted to")
+    parser.add_argument('--stream', action='store_true',
+                        help="parse the sites payload one site at a time as it's read, instead of fetching and decoding it whole")
+    parser.add_argument('--api-url', default=VoltaNetwork.API_URL,
+                        help="public sites endpoint to poll, e.g. a local stub server")
+    parser.add_argument('--storage', default='firestore',
+                        help="where documents are kept: firestore, memory or sqlite:///path")
+    parser.add_argument('--metrics', action='store_true',
+                        help="collect metrics and dump them periodically")
+    parser.add_argument('--metrics-file', default=None,
+                        help="file the prometheus text metrics are dumped to, logged if not set")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="split sites across this many worker processes")
+    parser.add_argument('--history-dir', default=None,
+                        help="directory meter transitions, sessions and their rollups are logged to")
+    parser.add_argument('--snapshot', default=None,
+                        help="file the in memory network is periodically snapshotted to and restored from at startup")
+    parser.add_argument('--snapshot-interval', type=float, default=300,
+                        help="seconds between snapshots")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_file is not None:
+        registry.enable()
+
+    if args.shards > 1:
+        volta_network = ShardedNetwork(
+            args.shards,
+            storage_url=args.storage,
+            poor=True,
+            preload=args.preload,
+            timezone_cache_path=args.timezone_cache,
+            stream=args.stream,
+            api_url=args.api_url,
+            history_dir=args.history_dir,
+            snapshot_path=args.snapshot,
+            snapshot_interval=args.snapshot_interval,
+            log_path=LOG_PATH
+        )
+    else:
+        volta_network = VoltaNetwork(
+            poor=True,
+            preload=args.preload,
+            timezone_cache_path=args.timezone_cache,
+            stream=args.stream,
+            api_url=args.api_url,
+            storage=create_storage(args.storage),
+            history_dir=args.history_dir,
+            snapshot_path=args.snapshot,
+            snapshot_interval=args.snapshot_interval
+        )
+    Poller(volta_network, interval=15, metrics_path=args.metrics_file).run()
@@ -1,17 +1,68 @@
-from collections import defaultdict
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+import queue
+import threading
+import time
 
-from flask import Flask, jsonify, request
+from cachetools import TTLCache
+from flask import Flask, Response, g, json, request, stream_with_context
 from flask_caching import Cache
 from flask_cors import CORS
-from google.cloud import firestore
 
-from volta_plus.models import meters_ref, sites_ref
+from volta_plus.events import StorageChangeBus
+from volta_plus.geo import SpatialIndex
+from volta_plus.history import HistoryReader
+from volta_plus.index import join_parts, serialize_sites
+from volta_plus.metrics import registry
+from volta_plus.models import VoltaMeter
+from volta_plus.occupancy import OccupancyEngine
+from volta_plus.responses import compress, dumps, json_response, negotiate
+from volta_plus.shared_cache import SharedCache
+from volta_plus.storage import get_storage
 
 
-def create_app(poor=False):
+request_seconds = registry.timer('volta_http_request_seconds', "time per request", ('endpoint',))
+responses = registry.counter('volta_http_responses_total', "responses by endpoint and status", ('endpoint', 'status'))
+meter_cache_lookups = registry.counter('volta_meter_cache_lookups_total', "meter cache lookups", ('result',))
+sites_index_loads = registry.counter('volta_sites_index_loads_total', "sites index lookups", ('result',))
+
+
+def reshape_meter(meter):
+    meter['weekly_usage'] = [meter['weekly_usage'][(i * 144):((i * 144) + 144)] for i in range(7)]
+    return meter
+
+
+def meter_response(meter):
+    charge_duration = 0
+    charge_start_time = meter['in_use_charging_stats']['start']
+    if charge_start_time is not None:
+        # documents published straight from the poller carry naive utc times
+        if charge_start_time.tzinfo is None:
+            charge_start_time = charge_start_time.replace(tzinfo=timezone.utc)
+        charge_duration = (datetime.now(timezone.utc) - charge_start_time).seconds
+    return dict(meter, charge_duration=charge_duration)
+
+
+def parse_time(value):
+    # dates or iso times, taken as utc unless they say otherwise
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def create_app(poor=False, meter_cache_ttl=5, change_bus=None, keepalive_interval=15, sites_index_ttl=30,
+               max_near_radius=100, storage=None, metrics=False, history_dir=None, max_history_buckets=24 * 31,
+               shared_cache_dir=None, network_epoch=None):
     app = Flask(__name__)
 
+    if metrics:
+        registry.enable()
+
+    if storage is None:
+        storage = get_storage()
+
     if poor:
         app.config['CACHE_TYPE'] = 'filesystem'
         app.config['CACHE_DIR'] = '.cache'
@@ -21,16 +72,79 @@ def create_app(poor=False):
     CORS(app)
     cache = Cache(app)
 
+    # meter documents with weekly_usage already reshaped, charge_duration is added per response
+    meter_cache = TTLCache(maxsize=16384, ttl=meter_cache_ttl)
+    meter_cache_lock = threading.Lock()
+
+    if change_bus is None:
+        change_bus = StorageChangeBus(storage)
+
+    occupancy_engine = OccupancyEngine(storage, network_epoch=network_epoch)
+    occupancy_lock = threading.Lock()
+
+    def on_meter_change(meter_id, meter):
+        # keep already cached meters current while the change bus is running
+        with meter_cache_lock:
+            if meter_id in meter_cache:
+                meter_cache[meter_id] = reshape_meter(dict(meter))
+        if 'weekly_usage' in meter:
+            occupancy_engine.update_meter(meter_id, meter['weekly_usage'], OccupancyEngine.first_seen_of(meter))
+
+    change_bus.add_listener(on_meter_change)
+
+    def load_meters(meter_ids):
+        with meter_cache_lock:
+            found = {meter_id: meter_cache.get(meter_id, None) for meter_id in meter_ids}
+
+        misses = [meter_id for meter_id, meter in found.items() if meter is None]
+        if registry.enabled:
+            meter_cache_lookups.inc(len(found) - len(misses), ('hit',))
+            meter_cache_lookups.inc(len(misses), ('miss',))
+        if misses:
+            for meter_id, meter in storage.get_many('meters', misses).items():
+                found[meter_id] = reshape_meter(meter)
+                with meter_cache_lock:
+                    meter_cache[meter_id] = found[meter_id]
+
+        return found
+
+    @app.before_request
+    def start_timer():
+        if registry.enabled:
+            g.start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        # streamed responses are only timed until their headers are sent
+        if registry.enabled and 'start' in g:
+            request_seconds.observe(time.perf_counter() - g.start, (request.endpoint,))
+            responses.inc(labels=(request.endpoint, response.status_code))
+        return response
+
     @app.route('/', methods=['GET'])
     def index():
         return "Volta+ API"
 
-    @app.route('/sites', methods=['GET'])
-    @cache.cached(timeout=86400)
-    def get_sites():
-        sites = defaultdict(lambda: defaultdict(list))
-        for site in list(sites_ref.stream()):
-            data = site.to_dict()
+    if metrics:
+        @app.route('/metrics', methods=['GET'])
+        def get_metrics():
+            return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    # the sites index document the poller maintains, re-read at most every sites_index_ttl seconds
+    sites_index = {
+        'payload': None,
+        'encodings': dict(),
+        'etag': None,
+        'loaded': None,
+        'locations': [],
+        'spatial_index': SpatialIndex([])
+    }
+    sites_index_lock = threading.Lock()
+
+    @cache.memoize(timeout=86400)
+    def scan_sites():
+        entries = list()
+        for _, data in list(storage.stream('sites')):
             if poor:
                 stations = list()
                 for station in data['stations']:
@@ -42,28 +156,255 @@ def create_app(poor=False):
             else:
                 stations = data['stations']
 
-            # ignore site if state or city is unknown
-            if data['state'] is not None and data['city'] is not None:
-                sites[data['state'].lower()][data['city'].lower()].append((data['name'], stations))
+            entries.append((data['state'], data['city'], data['name'], stations))
+
+        return serialize_sites(entries)
+
+    # shared by every worker process on the host, so only one of them re-reads the index when it expires
+    shared_cache = SharedCache(shared_cache_dir) if shared_cache_dir is not None else None
+
+    def read_sites_index(attempts=3, backoff=0.1):
+        for attempt in range(attempts):
+            head = storage.get('indexes', 'sites', ['payload', 'etag', 'locations'])
+            if head is None:
+                # fall back to scanning sites until the poller has written an index
+                return scan_sites()
+            if isinstance(head['payload'], str):
+                # written before the index was split into parts
+                return head
+
+            index = join_parts(head, storage.get_many('index_parts', head['payload'] + head['locations']))
+            if index is not None:
+                return index
+            # the poller is between writing a new index' parts and its head, give it a moment to finish
+            if attempt < attempts - 1:
+                time.sleep(backoff * 2 ** attempt)
+
+        logging.warning("sites index kept changing while it was read, keeping the last one loaded")
+        return None
+
+    def read_shared_sites_index():
+        def build():
+            index = read_sites_index()
+            if index is None:
+                return None
+            payload = index['payload'].encode()
+            fields = [index['etag'].encode(), payload, index.get('locations', '[]').encode()]
+            # compressed once for the whole host rather than once per worker
+            for encoding, body in compress(payload).items():
+                fields.extend((encoding.encode(), body))
+            return fields
 
-        return jsonify(sites)
+        # fields are memoryviews into the shared file's mapping, they're served without being copied
+        fields = shared_cache.get('sites', sites_index_ttl, build)
+        if fields is None:
+            return None
+        return {
+            'etag': str(fields[0], 'ascii'),
+            'payload': fields[1],
+            'locations': fields[2],
+            'encodings': {str(fields[i], 'ascii'): fields[i + 1] for i in range(3, len(fields), 2)}
+        }
+
+    def load_sites_index():
+        with sites_index_lock:
+            # the shared cache is checked on every request, it's a stat until some worker replaces the entry
+            if shared_cache is not None or sites_index['loaded'] is None or \
+                    time.monotonic() - sites_index['loaded'] > sites_index_ttl:
+                index = read_shared_sites_index() if shared_cache is not None else read_sites_index()
+                if index is None:
+                    if registry.enabled:
+                        sites_index_loads.inc(labels=('torn',))
+                    # the last index loaded is served until the next try, if there is one
+                    if sites_index['payload'] is not None:
+                        sites_index['loaded'] = time.monotonic()
+                    return dict(sites_index)
+
+                if registry.enabled:
+                    if index['etag'] != sites_index['etag']:
+                        sites_index_loads.inc(labels=('changed',))
+                    else:
+                        sites_index_loads.inc(labels=('shared' if shared_cache is not None else 'reloaded',))
+                if index['etag'] != sites_index['etag']:
+                    locations = index.get('locations', '[]')
+                    sites_index['locations'] = json.loads(bytes(locations) if isinstance(locations, memoryview) else locations)
+                    sites_index['spatial_index'] = SpatialIndex(sites_index['locations'])
+
+                    # serialized and compressed once per version of the index, never per request
+                    payload = index['payload']
+                    sites_index['payload'] = payload.encode() if isinstance(payload, str) else payload
+                    sites_index['encodings'] = index['encodings'] if 'encodings' in index else compress(sites_index['payload'])
+                elif shared_cache is not None:
+                    # the same index rebuilt into a new file, serving from it lets the old file's mapping go
+                    sites_index['payload'] = index['payload']
+                    sites_index['encodings'] = index['encodings']
+                sites_index['etag'] = index['etag']
+                sites_index['loaded'] = time.monotonic()
+            elif registry.enabled:
+                sites_index_loads.inc(labels=('cached',))
+
+            return dict(sites_index)
+
+    @app.route('/sites', methods=['GET'])
+    def get_sites():
+        index = load_sites_index()
+        if index['payload'] is None:
+            return "sites index unavailable", 503
+
+        encoding, body = negotiate(request, index['payload'], index['encodings'])
+        if isinstance(body, memoryview):
+            # a view into the shared cache's mapping is written out as is, a bare memoryview would be iterated by the byte
+            response = Response([body], mimetype='application/json')
+            response.content_length = len(body)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+            # each representation gets its own etag, a cache must not hand gzip bytes to a client that didn't ask
+            response.set_etag('{}-{}'.format(index['etag'], encoding))
+        else:
+            response.set_etag(index['etag'])
+        return response.make_conditional(request)
+
+    @app.route('/sites/near', methods=['GET'])
+    def get_sites_near():
+        try:
+            lat = float(request.args['lat'])
+            lng = float(request.args['lng'])
+            radius = min(float(request.args.get('radius', 10)), max_near_radius)
+            limit = int(request.args.get('limit', 20))
+        except (KeyError, ValueError):
+            return "invalid lat, lng, radius or limit", 400
+        if not all(math.isfinite(value) for value in (lat, lng, radius)) or abs(lat) > 90 or abs(lng) > 180:
+            return "invalid lat, lng, radius or limit", 400
+        if radius < 0 or limit < 1:
+            return "invalid lat, lng, radius or limit", 400
+        available = request.args.get('available', 'false').lower() == 'true'
+
+        candidates = load_sites_index()['spatial_index'].near(lng, lat, radius)
+
+        # only look up live meters for as many of the closest stations as it takes to fill the response
+        stations = list()
+        for i in range(0, len(candidates), limit):
+            chunk = candidates[i:(i + limit)]
+            found = load_meters([meter_id for _, location in chunk for meter_id in location['meters']])
+            for distance, location in chunk:
+                meters = [
+                    {'id': meter_id, 'state': meter['state'], 'availability': meter['availability']}
+                    for meter_id, meter in ((meter_id, found[meter_id]) for meter_id in location['meters'])
+                    if meter is not None
+                ]
+                if available and not any(VoltaMeter.is_idle(meter['state'], meter['availability']) for meter in meters):
+                    continue
+
+                stations.append(dict(location, distance=distance, meters=meters))
+                if len(stations) == limit:
+                    return json_response(stations)
+
+        return json_response(stations)
+
+    def load_occupancy():
+        index = load_sites_index()
+        with occupancy_lock:
+            # histograms are only read in full when the set of sites, stations or meters changes
+            if occupancy_engine.etag != index['etag']:
+                occupancy_engine.rebuild(index['locations'], index['etag'])
+                logging.info("rebuilt occupancy for {} meters in {:.3f}s".format(
+                    len(occupancy_engine.meter_rows),
+                    occupancy_engine.rebuild_time
+                ))
+                change_bus.start()
+        return occupancy_engine
+
+    @app.route('/sites/occupancy', methods=['GET'])
+    def get_sites_occupancy():
+        return json_response(load_occupancy().busy_now())
+
+    @app.route('/sites/<site_ids>/occupancy', methods=['GET'])
+    def get_site_occupancy(site_ids):
+        site_ids = site_ids.split(',')
+        profile = request.args.get('profile', 'false').lower() == 'true'
+        occupancies = load_occupancy().occupancy(site_ids, profile)
+
+        sites = list()
+        for site_id in site_ids:
+            occupancy = occupancies[site_id]
+            if occupancy is None:
+                return "invalid id {}".format(site_id), 404
+            sites.append(dict(occupancy, id=site_id))
+
+        return json_response(sites)
 
     @app.route('/meters/<meter_ids>', methods=['GET'])
     def get_meter(meter_ids):
+        meter_ids = meter_ids.split(',')
+        found = load_meters(meter_ids)
+
         meters = list()
-        for meter_id in meter_ids.split(','):
-            meter = meters_ref.document(meter_id).get().to_dict()
+        for meter_id in meter_ids:
+            meter = found[meter_id]
             if meter is not None:
-                charge_duration = 0
-                charge_start_time = meter['in_use_charging_stats']['start']
-                if charge_start_time is not None:
-                    charge_duration = (datetime.now(timezone.utc) - charge_start_time).seconds
-                meter['charge_duration'] = charge_duration
-                meter['weekly_usage'] = [meter['weekly_usage'][(i * 144):((i * 144) + 144)] for i in range(7)]
-                meters.append(meter)
+                meters.append(meter_response(meter))
             else:
                 return "invalid id {}".format(meter_id)
 
-        return jsonify(meters)
+        return json_response(meters)
+
+    history = HistoryReader(history_dir) if history_dir is not None else None
+
+    @app.route('/meters/<meter_id>/history', methods=['GET'])
+    def get_meter_history(meter_id):
+        if history is None:
+            return "history is not enabled", 404
+
+        resolution = request.args.get('resolution', 'hour')
+        try:
+            end = parse_time(request.args['to']) if 'to' in request.args else datetime.now(timezone.utc)
+            start = parse_time(request.args['from']) if 'from' in request.args else end - timedelta(days=1)
+        except ValueError:
+            return "invalid from or to", 400
+        if resolution not in HistoryReader.resolutions:
+            return "invalid resolution", 400
+
+        bucket = timedelta(hours=1) if resolution == 'hour' else timedelta(days=1)
+        if not start < end or (end - start) / bucket > max_history_buckets:
+            return "invalid from or to", 400
+
+        buckets = history.query(meter_id, start, end, resolution)
+        if buckets is None:
+            return "invalid id {}".format(meter_id), 404
+
+        return json_response({'id': meter_id, 'resolution': resolution, 'buckets': buckets})
+
+    @app.route('/meters/stream', methods=['GET'])
+    def stream_meters():
+        meter_ids = [meter_id for meter_id in request.args.get('ids', '').split(',') if meter_id]
+        if not meter_ids:
+            return "missing ids", 400
+
+        def event(meter_id, meter):
+            return "data: {}\n\n".format(dumps({'id': meter_id, 'meter': meter_response(meter)}).decode())
+
+        def events():
+            with change_bus.subscribe(meter_ids) as subscription:
+                # start every client off with the current state, then only send changes
+                for meter_id, meter in load_meters(meter_ids).items():
+                    if meter is not None:
+                        yield event(meter_id, meter)
+
+                while True:
+                    try:
+                        meter_id, meter = subscription.get(timeout=keepalive_interval)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield event(meter_id, reshape_meter(dict(meter)))
+
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
     return app
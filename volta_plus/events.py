@@ -0,0 +1,105 @@
+from collections import defaultdict
+import logging
+import queue
+import threading
+
+
+class Subscription:
+    def __init__(self, change_bus, meter_ids, maxsize=256):
+        self.change_bus = change_bus
+        self.meter_ids = frozenset(meter_ids)
+        self.events = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, meter_id, meter):
+        # a client too slow to keep up loses its oldest events rather than holding up the publisher
+        while True:
+            try:
+                self.events.put_nowait((meter_id, meter))
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.events.get(timeout=timeout)
+
+    def close(self):
+        self.change_bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChangeBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self.listeners = list()
+
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, meter_ids):
+        subscription = Subscription(self, meter_ids)
+        with self.lock:
+            for meter_id in subscription.meter_ids:
+                self.subscriptions[meter_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for meter_id in subscription.meter_ids:
+                subscriptions = self.subscriptions.get(meter_id, None)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self.subscriptions[meter_id]
+
+    def start(self):
+        pass
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def publish(self, meter_id, meter):
+        self.published += 1
+        for listener in self.listeners:
+            listener(meter_id, meter)
+
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(meter_id, ()))
+        for subscription in subscriptions:
+            subscription.put(meter_id, meter)
+        self.delivered += len(subscriptions)
+
+
+class StorageChangeBus(ChangeBus):
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+        self.watch = None
+        self.watch_lock = threading.Lock()
+
+    def start(self):
+        # one collection listener per process, started once somebody is interested
+        with self.watch_lock:
+            if self.watch is None:
+                logging.info("watching meters for changes")
+                self.watch = self.storage.watch('meters', self.publish)
+
+    def subscribe(self, meter_ids):
+        self.start()
+        return super().subscribe(meter_ids)
+
+    def close(self):
+        with self.watch_lock:
+            if self.watch is not None:
+                self.watch.unsubscribe()
+                self.watch = None
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+import gzip
+import http.client
+import logging
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+
+class CountingReader:
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fp.read() if size is None or size < 0 else self.fp.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class ApiFetcher:
+    def __init__(self, url, timeout=30):
+        self.url = url
+
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path = '{}?{}'.format(self.path, parts.query)
+        self.timeout = timeout
+
+        self.connection = None
+        self.etag = None
+        self.last_modified = None
+
+        self.bytes_transferred = 0
+        self.latency = 0
+        self.not_modified = False
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+
+        # a kept alive connection may have been dropped by the server since the last poll, retry once on a new one
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request('GET', self.path, headers=headers)
+                return self.connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    @contextmanager
+    def open(self):
+        start = time.perf_counter()
+        self.bytes_transferred = 0
+        self.not_modified = False
+
+        response = self.request()
+        reader = CountingReader(response)
+        try:
+            if response.status == 304:
+                reader.read()
+                self.not_modified = True
+                yield None
+            elif response.status != 200:
+                raise HTTPError(self.url, response.status, response.reason, response.msg, None)
+            else:
+                if response.getheader('Content-Encoding', '').lower() == 'gzip':
+                    yield gzip.GzipFile(fileobj=reader)
+                else:
+                    yield reader
+
+                # drain whatever the caller left unread so the connection can be reused
+                while reader.read(65536):
+                    pass
+
+                self.etag = response.getheader('ETag', None)
+                self.last_modified = response.getheader('Last-Modified', None)
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            if response.will_close:
+                self.close()
+
+            self.bytes_transferred = reader.bytes_read
+            self.latency = time.perf_counter() - start
+            logging.info("fetched {} bytes in {:.3f}s{}".format(
+                self.bytes_transferred,
+                self.latency,
+                " (not modified)" if self.not_modified else ""
+            ))
+
+    def fetch(self):
+        with self.open() as f:
+            return f.read() if f is not None else None
@@ -0,0 +1,61 @@
+from collections import defaultdict
+import math
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine(lng1, lat1, lng2, lat2):
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+class SpatialIndex:
+    def __init__(self, locations, cell_size=0.1):
+        self.cell_size = cell_size
+        self.locations = list()
+        self.cells = defaultdict(list)
+
+        for location in locations:
+            coordinates = location.get('coordinates', None)
+            if coordinates is None:
+                continue
+            lng, lat = coordinates
+            self.cells[self.cell(lng, lat)].append(len(self.locations))
+            self.locations.append(location)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def cell(self, lng, lat):
+        return int(math.floor(lng / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+    def near(self, lng, lat, radius):
+        # scan the grid cells covering the radius' bounding box, then check real distances
+        lat_delta = radius / KM_PER_DEGREE
+        lng_span = KM_PER_DEGREE * math.cos(math.radians(lat))
+        if radius >= 180 * lng_span:
+            # close enough to a pole that the box goes all the way around
+            min_lng, max_lng = -180, 180
+        else:
+            min_lng, max_lng = lng - radius / lng_span, lng + radius / lng_span
+        min_x, min_y = self.cell(min_lng, max(lat - lat_delta, -90))
+        max_x, max_y = self.cell(max_lng, min(lat + lat_delta, 90))
+
+        # a box covering more cells than the index holds is cheaper to check occupied cell by occupied cell
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.cells):
+            cells = [(x, y) for x, y in self.cells if min_x <= x <= max_x and min_y <= y <= max_y]
+        else:
+            cells = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+        found = list()
+        for cell in cells:
+            for i in self.cells.get(cell, ()):
+                location = self.locations[i]
+                distance = haversine(lng, lat, location['coordinates'][0], location['coordinates'][1])
+                if distance <= radius:
+                    found.append((distance, i))
+
+        found.sort()
+        return [(distance, self.locations[i]) for distance, i in found]
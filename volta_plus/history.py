@@ -0,0 +1,259 @@
+from datetime import datetime, timedelta, timezone
+import glob
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# rollup columns, one row per meter code and one bucket per hour or day
+CHARGING_SECONDS = 0
+STOPPED_SECONDS = 1
+SESSIONS = 2
+ROLLUP_COLUMNS = 3
+
+# session kinds in the session log
+CHARGING = 0
+STOPPED = 1
+
+transition_record = struct.Struct('<dIBB')
+session_record = struct.Struct('<IBdd')
+
+
+def utc_timestamp(utc_time):
+    # the poller keeps naive utc times, times read back from storage are aware
+    if utc_time.tzinfo is None:
+        utc_time = utc_time.replace(tzinfo=timezone.utc)
+    return utc_time.timestamp()
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+def open_rollup(path, capacity, buckets):
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r+')
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(capacity, buckets, ROLLUP_COLUMNS))
+
+
+class HistoryLog:
+    def __init__(self, directory, capacity=1024, rollup_cache_size=4):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+
+        # meter ids are appended to meters.txt, a meter's code is its line number
+        self.meter_codes = dict()
+        self.meter_ids_path = os.path.join(directory, 'meters.txt')
+        if os.path.exists(self.meter_ids_path):
+            with open(self.meter_ids_path) as f:
+                for line in f:
+                    self.meter_codes[line.rstrip('\n')] = len(self.meter_codes)
+        self.new_meter_ids = list()
+        self.capacity = max(capacity, len(self.meter_codes))
+
+        # raw records waiting to be appended, by log name
+        self.pending = dict()
+
+        # memory mapped hourly rollups per day and daily rollups per month, only the recent few stay open
+        self.rollups = dict()
+        self.rollup_cache_size = rollup_cache_size
+
+        self.transitions_logged = 0
+        self.sessions_logged = 0
+
+    def meter_code(self, meter_id):
+        code = self.meter_codes.get(meter_id, None)
+        if code is None:
+            code = len(self.meter_codes)
+            self.meter_codes[meter_id] = code
+            self.new_meter_ids.append(meter_id)
+        return code
+
+    def append(self, name, data):
+        pending = self.pending.get(name, None)
+        if pending is None:
+            pending = self.pending[name] = bytearray()
+        pending += data
+
+    def rollup(self, name, buckets):
+        rollup = self.rollups.pop(name, None)
+        if rollup is None:
+            rollup = open_rollup(os.path.join(self.directory, name), self.capacity, buckets)
+        if len(rollup) < self.capacity:
+            rollup = self.grow(name, rollup)
+
+        # most recently used last, the oldest is closed once too many are open
+        self.rollups[name] = rollup
+        if len(self.rollups) > self.rollup_cache_size:
+            oldest = next(iter(self.rollups))
+            self.rollups.pop(oldest).flush()
+        return rollup
+
+    def grow(self, name, rollup):
+        path = os.path.join(self.directory, name)
+        tmp_path = '{}.tmp'.format(path)
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=rollup.dtype, shape=(self.capacity,) + rollup.shape[1:])
+        grown[:len(rollup)] = rollup
+        grown.flush()
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r+')
+
+    def record(self, meter_id, old_status, new_status, charging_start=None, stopped_start=None):
+        # starts are only passed for sessions the transition just ended
+        if old_status == new_status:
+            return
+        now = time.time()
+
+        with self.lock:
+            code = self.meter_code(meter_id)
+            if code >= self.capacity:
+                self.capacity *= 2
+
+            self.append('transitions-{}.bin'.format(day_of(now)), transition_record.pack(now, code, old_status, new_status))
+            self.transitions_logged += 1
+
+            if charging_start is not None:
+                self.add_session(code, CHARGING, utc_timestamp(charging_start), now)
+            if stopped_start is not None:
+                self.add_session(code, STOPPED, utc_timestamp(stopped_start), now)
+
+    def add_session(self, code, kind, start, end):
+        self.append('sessions-{}.bin'.format(day_of(start)), session_record.pack(code, kind, start, end))
+        self.sessions_logged += 1
+
+        # sessions are rolled up once they end, split across every hour they overlap
+        column = CHARGING_SECONDS if kind == CHARGING else STOPPED_SECONDS
+        hour = start - (start % 3600)
+        while hour < end:
+            seconds = min(end, hour + 3600) - max(start, hour)
+            moment = datetime.fromtimestamp(hour, timezone.utc)
+            self.rollup('hourly-{:%Y-%m-%d}.npy'.format(moment), 24)[code, moment.hour, column] += seconds
+            self.rollup('daily-{:%Y-%m}.npy'.format(moment), 31)[code, moment.day - 1, column] += seconds
+            hour += 3600
+
+        if kind == CHARGING:
+            moment = datetime.fromtimestamp(start, timezone.utc)
+            self.rollup('hourly-{:%Y-%m-%d}.npy'.format(moment), 24)[code, moment.hour, SESSIONS] += 1
+            self.rollup('daily-{:%Y-%m}.npy'.format(moment), 31)[code, moment.day - 1, SESSIONS] += 1
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = dict()
+            new_meter_ids = self.new_meter_ids
+            self.new_meter_ids = list()
+
+            # meter ids go first so no record on disk refers to an unknown code
+            if new_meter_ids:
+                with open(self.meter_ids_path, 'a') as f:
+                    f.write(''.join('{}\n'.format(meter_id) for meter_id in new_meter_ids))
+            for name, data in pending.items():
+                with open(os.path.join(self.directory, name), 'ab') as f:
+                    f.write(data)
+            for rollup in self.rollups.values():
+                rollup.flush()
+
+
+class HistoryReader:
+    resolutions = ('hour', 'day')
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+
+        # meter id -> (directory, code), across the root and one directory per shard
+        self.meters = dict()
+        self.offsets = dict()
+
+    def refresh(self):
+        paths = glob.glob(os.path.join(self.root, 'meters.txt')) + glob.glob(os.path.join(self.root, '*', 'meters.txt'))
+        for path in paths:
+            directory = os.path.dirname(path)
+            code, offset = self.offsets.get(path, (0, 0))
+            # meters.txt is append only, so only the lines added since the last refresh are read
+            with open(path) as f:
+                f.seek(offset)
+                for line in iter(f.readline, ''):
+                    if not line.endswith('\n'):
+                        break
+                    self.meters[line[:-1]] = (directory, code)
+                    code += 1
+                    offset = f.tell()
+            self.offsets[path] = (code, offset)
+
+    def locate(self, meter_id):
+        with self.lock:
+            if meter_id not in self.meters:
+                self.refresh()
+            return self.meters.get(meter_id, None)
+
+    def read_row(self, path, code, buckets):
+        if not os.path.exists(path):
+            return np.zeros((buckets, ROLLUP_COLUMNS), dtype=np.float32)
+        rollup = np.load(path, mmap_mode='r')
+        if code >= len(rollup):
+            return np.zeros((buckets, ROLLUP_COLUMNS), dtype=np.float32)
+        return np.array(rollup[code])
+
+    def query(self, meter_id, start, end, resolution):
+        location = self.locate(meter_id)
+        if location is None:
+            return None
+        directory, code = location
+
+        buckets = list()
+        if resolution == 'hour':
+            day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < end:
+                row = self.read_row(os.path.join(directory, 'hourly-{:%Y-%m-%d}.npy'.format(day)), code, 24)
+                for hour in range(24):
+                    bucket = day + timedelta(hours=hour)
+                    if start <= bucket < end:
+                        buckets.append((bucket, row[hour]))
+                day += timedelta(days=1)
+        else:
+            month = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            while month < end:
+                row = self.read_row(os.path.join(directory, 'daily-{:%Y-%m}.npy'.format(month)), code, 31)
+                day = month
+                while day.month == month.month:
+                    if start <= day < end:
+                        buckets.append((day, row[day.day - 1]))
+                    day += timedelta(days=1)
+                month = day
+
+        return [
+            {
+                'start': bucket.isoformat(),
+                'charging_seconds': float(values[CHARGING_SECONDS]),
+                'stopped_seconds': float(values[STOPPED_SECONDS]),
+                'sessions': int(values[SESSIONS])
+            }
+            for bucket, values in buckets
+        ]
+
+
+def rebuild_rollups(directory):
+    # rollups are memory mapped and only flushed with the logs, the session logs can always recreate them
+    for path in glob.glob(os.path.join(directory, 'hourly-*.npy')) + glob.glob(os.path.join(directory, 'daily-*.npy')):
+        os.remove(path)
+
+    history = HistoryLog(directory)
+    for path in sorted(glob.glob(os.path.join(directory, 'sessions-*.bin'))):
+        with open(path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - (len(data) % session_record.size)
+        if usable != len(data):
+            logging.warning("ignoring a truncated record at the end of {}".format(path))
+        for code, kind, start, end in session_record.iter_unpack(data[:usable]):
+            history.add_session(code, kind, start, end)
+
+    # the logs are already on disk, only the rollups needed writing
+    history.pending = dict()
+    history.flush()
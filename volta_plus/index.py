@@ -0,0 +1,131 @@
+from collections import defaultdict
+import hashlib
+import json
+
+
+class SitesIndex:
+    # firestore rejects documents over 1 MiB, parts are kept to half that so even an escaped copy would fit
+    max_part_size = 500000
+
+    def __init__(self):
+        self.entries = dict()
+        self.locations = dict()
+        self.dirty = False
+
+        # parts alternate between two sets of documents, the set the current head points at is never overwritten,
+        # picked up from the stored head on the first write so a restarted writer doesn't start on the live set
+        self.generation = None
+
+        # site ids updated since the last take_changes, for merging into another process' index
+        self.changed = set()
+
+    def __contains__(self, site_id):
+        return site_id in self.entries
+
+    def update(self, site_id, volta_site):
+        entry = (
+            volta_site.state,
+            volta_site.city,
+            volta_site.name,
+            [volta_station.index_serialize() for volta_station in volta_site.stations.values()]
+        )
+        if self.entries.get(site_id, None) != entry:
+            self.entries[site_id] = entry
+            self.dirty = True
+            self.changed.add(site_id)
+
+        locations = [
+            {
+                'site_id': site_id,
+                'site': volta_site.name,
+                'station_id': station_id,
+                'station': volta_station.name,
+                'coordinates': volta_station.coordinates,
+                'timezone': volta_station.timezone.zone if volta_station.timezone is not None else None,
+                'meters': [meter_id for meter_id in volta_station.meters]
+            }
+            for station_id, volta_station in volta_site.stations.items()
+            if volta_station.coordinates is not None
+        ]
+        if self.locations.get(site_id, None) != locations:
+            self.locations[site_id] = locations
+            self.dirty = True
+            self.changed.add(site_id)
+
+    def take_changes(self):
+        changes = {site_id: (self.entries[site_id], self.locations[site_id]) for site_id in self.changed}
+        self.changed = set()
+        self.dirty = False
+        return changes
+
+    def merge(self, changes):
+        for site_id, (entry, locations) in changes.items():
+            self.entries[site_id] = entry
+            self.locations[site_id] = locations
+        if changes:
+            self.dirty = True
+
+    @staticmethod
+    def stored_generation(storage):
+        head = storage.get('indexes', 'sites', ['payload'])
+        if head is None or isinstance(head['payload'], str) or not head['payload']:
+            return 0
+        return int(head['payload'][0].split('-')[2])
+
+    def serialize(self):
+        index = serialize_sites(self.entries.values())
+        locations = json.dumps(
+            [location for locations in self.locations.values() for location in locations],
+            separators=(',', ':')
+        )
+
+        self.generation = 1 - self.generation
+        head = {'etag': index['etag'], 'payload': [], 'locations': []}
+        parts = dict()
+        for field, value in (('payload', index['payload']), ('locations', locations)):
+            for i, offset in enumerate(range(0, max(len(value), 1), self.max_part_size)):
+                part_id = 'sites-{}-{}-{}'.format(field, self.generation, i)
+                parts[part_id] = {'etag': index['etag'], 'data': value[offset:(offset + self.max_part_size)]}
+                head[field].append(part_id)
+        return head, parts
+
+    def write(self, write_buffer):
+        if self.generation is None:
+            self.generation = self.stored_generation(write_buffer.storage)
+        elif ('indexes', 'sites') in write_buffer.pending:
+            # the last head never made it, the stored one still points at the other set, so this set is rewritten
+            self.generation = 1 - self.generation
+        head, parts = self.serialize()
+        for part_id, part in parts.items():
+            write_buffer.set('index_parts', part_id, part)
+        write_buffer.set('indexes', 'sites', head)
+        self.dirty = False
+
+
+def join_parts(head, parts):
+    # None if a part is missing or already belongs to a newer index, the head is then read again
+    fields = dict()
+    for field in ('payload', 'locations'):
+        values = list()
+        for part_id in head[field]:
+            part = parts.get(part_id, None)
+            if part is None or part['etag'] != head['etag']:
+                return None
+            values.append(part['data'])
+        fields[field] = ''.join(values)
+    return {'etag': head['etag'], 'payload': fields['payload'], 'locations': fields['locations']}
+
+
+def serialize_sites(entries):
+    sites = defaultdict(lambda: defaultdict(list))
+    for state, city, name, stations in entries:
+        # ignore site if state or city is unknown
+        if state is not None and city is not None:
+            sites[state.lower()][city.lower()].append((name, stations))
+
+    # firestore can't hold the nested (name, stations) arrays, so the index is stored as its json response
+    payload = json.dumps(sites, sort_keys=True, separators=(',', ':'))
+    return {
+        'payload': payload,
+        'etag': hashlib.sha1(payload.encode()).hexdigest()
+    }
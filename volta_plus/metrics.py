@@ -0,0 +1,132 @@
+from contextlib import nullcontext
+import threading
+import time
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def format_labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{{{}}}'.format(','.join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in pairs))
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, labels, repr(float(value))))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield self.name, self.format_labels(labels), value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield self.name, self.format_labels(labels), value
+
+
+class TimerContext:
+    __slots__ = ('timer', 'labels', 'start')
+
+    def __init__(self, timer, labels):
+        self.timer = timer
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.observe(time.perf_counter() - self.start, self.labels)
+
+
+class Timer(Metric):
+    kind = 'summary'
+
+    _null = nullcontext()
+
+    def observe(self, seconds, labels=()):
+        with self.lock:
+            cnt, total, longest = self.values.get(labels, (0, 0, 0))
+            self.values[labels] = (cnt + 1, total + seconds, max(longest, seconds))
+
+    def time(self, labels=()):
+        # disabled timers hand back a shared no-op context so the timed block costs one attribute check
+        if not self.registry.enabled:
+            return self._null
+        return TimerContext(self, labels)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, (cnt, total, longest) in values:
+            yield '{}_count'.format(self.name), self.format_labels(labels), cnt
+            yield '{}_sum'.format(self.name), self.format_labels(labels), total
+            yield self.name, self.format_labels(labels, [('quantile', '1')]), longest
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def register(self, metric_class, name, help, labelnames=()):
+        with self.lock:
+            metric = self.metrics.get(name, None)
+            if metric is None:
+                metric = metric_class(self, name, help, labelnames)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge, name, help, labelnames)
+
+    def timer(self, name, help, labelnames=()):
+        return self.register(Timer, name, help, labelnames)
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
@@ -1,20 +1,49 @@
+from array import array
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
+from enum import IntEnum
+import gc
+import io
 import json
 import logging
+import math
 import os.path
-from urllib.request import urlopen
+import threading
+import time
 
 from google.api_core.datetime_helpers import DatetimeWithNanoseconds
-from google.cloud import firestore
-import pytz
-from timezonefinder import TimezoneFinder
-
-
-_db = firestore.Client()
-sites_ref = _db.collection('sites')
-stations_ref = _db.collection('stations')
-meters_ref = _db.collection('meters')
+import numpy as np
+
+from volta_plus.fetch import ApiFetcher
+from volta_plus.history import HistoryLog
+from volta_plus.index import SitesIndex
+from volta_plus.metrics import registry
+from volta_plus.snapshot import SNAPSHOT_VERSION, SnapshotWriter, read_snapshot, snapshot_seconds
+from volta_plus.storage import get_storage
+from volta_plus.streaming import iter_array
+from volta_plus.timezones import TimezoneCache, get_timezone
+
+
+update_seconds = registry.timer('volta_update_seconds', "time spent in each stage of a poll cycle", ('stage',))
+sites_parsed = registry.counter('volta_sites_parsed_total', "sites seen in payloads, by whether they were unchanged", ('result',))
+storage_reads = registry.counter('volta_storage_reads_total', "documents read one at a time", ('collection',))
+storage_read_seconds = registry.timer('volta_storage_read_seconds', "time per single document read", ('collection',))
+storage_writes = registry.counter('volta_storage_writes_total', "documents written by the write buffer")
+storage_write_seconds = registry.timer('volta_storage_write_seconds', "time per committed write batch")
+meter_transitions = registry.counter('volta_meter_transitions_total', "meter updates by previous and new status", ('from', 'to'))
+timezone_lookups = registry.counter('volta_timezone_lookups_total', "coordinates to timezone lookups", ('result',))
+
+EPOCH = datetime(1970, 1, 1)
+
+def naive_utc(value):
+    # in use starts are kept naive utc like DatetimeWithNanoseconds.utcnow(), storage hands them back aware
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return DatetimeWithNanoseconds(
+        value.year, value.month, value.day, value.hour, value.minute, value.second, value.microsecond
+    )
 
 def log_warning(msg, data):
     logging.warning("--------------------------------------------------------------")
@@ -23,7 +52,242 @@ def log_warning(msg, data):
     logging.warning("--------------------------------------------------------------")
 
 
+class WriteBuffer:
+    max_batch_size = 500
+
+    # index parts are each close to firestore's 1 MiB document limit, so they're committed one per batch
+    batch_sizes = {'index_parts': 1}
+
+    # documents are committed in stages, a stage after the first is held back if an earlier one failed,
+    # so the sites index head is never written ahead of its parts
+    commit_stages = {'index_parts': 1, 'indexes': 2}
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.pending = dict()
+        # the writes a flush has swapped out, until they're committed
+        self.in_flight = dict()
+        self.lock = threading.Lock()
+
+        self.docs_queued = 0
+        self.docs_written = 0
+        self.batches = 0
+        self.flush_latency = 0
+
+    def reset_stats(self):
+        self.docs_queued = 0
+
+    def set(self, collection, doc_id, data):
+        # later writes to the same document replace earlier ones until the next flush
+        with self.lock:
+            self.pending[(collection, doc_id)] = data
+            self.docs_queued += 1
+
+    def flush(self):
+        start = time.perf_counter()
+        docs_written = 0
+        batches = 0
+
+        # swap the buffer out so parsing can keep queueing writes while these are committed
+        with self.lock:
+            pending = self.pending
+            self.pending = dict()
+            self.in_flight = pending
+
+        # every collection gets batches of its own, a rejected document only holds back the batch it's in
+        collections = dict()
+        for key in pending:
+            collections.setdefault(key[0], list()).append(key)
+
+        committed = set()
+        error = None
+        failed_stage = None
+        try:
+            for collection in sorted(collections, key=lambda collection: self.commit_stages.get(collection, 0)):
+                stage = self.commit_stages.get(collection, 0)
+                if failed_stage is not None and stage > failed_stage:
+                    continue
+
+                keys = collections[collection]
+                batch_size = self.batch_sizes.get(collection, self.max_batch_size)
+                for i in range(0, len(keys), batch_size):
+                    chunk = keys[i:(i + batch_size)]
+                    try:
+                        with storage_write_seconds.time():
+                            self.storage.put_many([(collection, doc_id, pending[(collection, doc_id)]) for collection, doc_id in chunk])
+                    except Exception as e:
+                        logging.exception(e)
+                        if error is None:
+                            error = e
+                        if stage > 0 and failed_stage is None:
+                            failed_stage = stage
+                        continue
+
+                    committed.update(chunk)
+                    docs_written += len(chunk)
+                    batches += 1
+        finally:
+            # uncommitted writes are retried on the next flush unless superseded since
+            with self.lock:
+                for key, data in pending.items():
+                    if key not in committed:
+                        self.pending.setdefault(key, data)
+                self.in_flight = dict()
+
+            self.docs_written = docs_written
+            self.batches = batches
+            if registry.enabled:
+                storage_writes.inc(docs_written)
+            self.flush_latency = time.perf_counter() - start
+
+        if error is not None:
+            raise error
+
+    def pending_keys(self):
+        # everything not known to be committed, including a flush still under way
+        with self.lock:
+            return list(self.pending) + [key for key in self.in_flight if key not in self.pending]
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class MeterStore:
+    weekly_usage_buckets = 144 * 7
+
+    # the array.array columns, in_use stats starts are a plain list alongside them
+    columns = ('state', 'availability', 'status', 'stale', 'weekly_usage_update', 'first_seen', 'stats_cnt', 'stats_avg')
+
+    _default = None
+
+    def __init__(self, capacity=64):
+        self.size = 0
+
+        # state and availability strings are interned, code 0 is None
+        self.strings = [None]
+        self.string_codes = {None: 0}
+        self.pair_codes = dict()
+
+        # per meter scalar columns, array.array keeps them compact while indexing to plain ints
+        self.state = array('H')
+        self.availability = array('H')
+        self.status = array('B')
+        self.stale = array('B')
+        self.weekly_usage_update = array('h')
+        # unix time the poller first saw the meter, how many weeks its weekly_usage has been counting for
+        self.first_seen = array('d')
+
+        # in use stats are stored two per meter, charging at 2 * row and stopped at 2 * row + 1
+        self.stats_start = list()
+        self.stats_cnt = array('L')
+        self.stats_avg = array('d')
+
+        self.weekly_usage = np.zeros((capacity, self.weekly_usage_buckets), dtype=np.uint16)
+
+    @classmethod
+    def default(cls):
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def nbytes(self):
+        columns = [getattr(self, name) for name in self.columns]
+        return sum(column.itemsize * len(column) for column in columns) + self.weekly_usage[:self.size].nbytes
+
+    def to_arrays(self):
+        # copies, so they can be written out while parsing carries on
+        arrays = {name: np.array(getattr(self, name), dtype=getattr(self, name).typecode) for name in self.columns}
+        arrays['stats_start'] = np.array(
+            [(start - EPOCH).total_seconds() if start is not None else np.nan for start in self.stats_start],
+            dtype=np.float64
+        )
+        arrays['weekly_usage'] = self.weekly_usage[:self.size].copy()
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, strings, arrays):
+        size = len(arrays['status'])
+        store = cls(capacity=max(64, size))
+        store.size = size
+
+        store.strings = list(strings)
+        store.string_codes = {string: code for code, string in enumerate(store.strings)}
+
+        for name in cls.columns:
+            column = getattr(store, name)
+            column.frombytes(arrays[name].astype(column.typecode, copy=False).tobytes())
+
+        stats_start = arrays['stats_start']
+        store.stats_start = [None] * len(stats_start)
+        for index in np.flatnonzero(~np.isnan(stats_start)):
+            store.stats_start[index] = naive_utc(EPOCH + timedelta(seconds=float(stats_start[index])))
+
+        store.weekly_usage[:size] = arrays['weekly_usage']
+        return store
+
+    def intern(self, string):
+        code = self.string_codes.get(string, None)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(string)
+            self.string_codes[string] = code
+        return code
+
+    def codes(self, state, availability):
+        codes = self.pair_codes.get((state, availability), None)
+        if codes is None:
+            codes = (self.intern(state), self.intern(availability), VoltaMeter.status_of(state, availability))
+            self.pair_codes[(state, availability)] = codes
+        return codes
+
+    def allocate(self):
+        if self.size == len(self.weekly_usage):
+            weekly_usage = np.zeros((2 * self.size, self.weekly_usage_buckets), dtype=self.weekly_usage.dtype)
+            weekly_usage[:self.size] = self.weekly_usage
+            self.weekly_usage = weekly_usage
+
+        self.state.append(0)
+        self.availability.append(0)
+        self.status.append(MeterStatus.INVALID)
+        self.stale.append(True)
+        self.weekly_usage_update.append(-1)
+        # unknown until set, meters read back from documents written before it was tracked keep it that way
+        self.first_seen.append(math.nan)
+        self.stats_start.extend((None, None))
+        self.stats_cnt.extend((0, 0))
+        self.stats_avg.extend((0, 0))
+
+        row = self.size
+        self.size += 1
+        return row
+
+
+class MeterStatus(IntEnum):
+    INVALID = 0
+    IDLE = 1
+    OTHER = 2
+    IN_USE_CHARGING = 3
+    IN_USE_STOPPED = 4
+
+
 class VoltaMeter:
+    __slots__ = ('store', 'row', 'in_use_charging_stats', 'in_use_stopped_stats')
+
+    field_paths = ['state', 'availability', 'first_seen', 'weekly_usage', 'in_use_charging_stats', 'in_use_stopped_stats']
+
+    # update actions, looked up by (old status, new status) in transitions
+    IGNORE = 1 << 0
+    CHARGING_START = 1 << 1
+    CHARGING_END = 1 << 2
+    STOPPED_START = 1 << 3
+    STOPPED_END = 1 << 4
+    WEEKLY_USAGE = 1 << 5
+    TIMED = CHARGING_START | CHARGING_END | STOPPED_START | STOPPED_END | WEEKLY_USAGE
+
+    transitions = None
+    transition_labels = [[(old.name.lower(), new.name.lower()) for new in MeterStatus] for old in MeterStatus]
+
     idle_states = {'idle', 'pluggedout'}
     idle_availabilities = {'available'}
     in_use_charging_states = {'charging', 'pluggedin'}
@@ -32,10 +296,35 @@ class VoltaMeter:
     in_use_stopped_availabilities = {'in use'}
 
     class InUseStats:
-        def __init__(self):
-            self.start = None
-            self.cnt = 0
-            self.avg = 0
+        __slots__ = ('store', 'index')
+
+        def __init__(self, store, index):
+            self.store = store
+            self.index = index
+
+        @property
+        def start(self):
+            return self.store.stats_start[self.index]
+
+        @start.setter
+        def start(self, start):
+            self.store.stats_start[self.index] = start
+
+        @property
+        def cnt(self):
+            return self.store.stats_cnt[self.index]
+
+        @cnt.setter
+        def cnt(self, cnt):
+            self.store.stats_cnt[self.index] = cnt
+
+        @property
+        def avg(self):
+            return self.store.stats_avg[self.index]
+
+        @avg.setter
+        def avg(self, avg):
+            self.store.stats_avg[self.index] = avg
 
         def update_avg(self, utc_time):
             self.cnt += 1
@@ -54,94 +343,221 @@ class VoltaMeter:
                 'avg': self.avg
             }
 
-    def __init__(self):
-        self.state = None
-        self.availability = None
+    def __init__(self, store=None, row=None):
+        # a row is only passed in for meters restored into a store that already holds their columns
+        self.store = store if store is not None else MeterStore.default()
+        self.row = row if row is not None else self.store.allocate()
 
-        self.in_use_charging_stats = self.InUseStats()
-        self.in_use_stopped_stats = self.InUseStats()
+        self.in_use_charging_stats = self.InUseStats(self.store, 2 * self.row)
+        self.in_use_stopped_stats = self.InUseStats(self.store, (2 * self.row) + 1)
 
-        self.weekly_usage_update = -1
-        self.weekly_usage = [0] * (144 * 7)
+    @property
+    def state(self):
+        return self.store.strings[self.store.state[self.row]]
 
-        self.stale = True
+    @state.setter
+    def state(self, state):
+        self.store.state[self.row] = self.store.intern(state)
+        self.store.status[self.row] = self.status_of(state, self.availability)
+
+    @property
+    def availability(self):
+        return self.store.strings[self.store.availability[self.row]]
+
+    @availability.setter
+    def availability(self, availability):
+        self.store.availability[self.row] = self.store.intern(availability)
+        self.store.status[self.row] = self.status_of(self.state, availability)
+
+    @property
+    def status(self):
+        return MeterStatus(self.store.status[self.row])
+
+    @property
+    def in_use(self):
+        return self.store.status[self.row] >= MeterStatus.IN_USE_CHARGING
+
+    @property
+    def stale(self):
+        return self.store.stale[self.row] != 0
+
+    @stale.setter
+    def stale(self, stale):
+        self.store.stale[self.row] = stale
+
+    @property
+    def weekly_usage_update(self):
+        return self.store.weekly_usage_update[self.row]
+
+    @weekly_usage_update.setter
+    def weekly_usage_update(self, weekly_usage_update):
+        self.store.weekly_usage_update[self.row] = weekly_usage_update
+
+    @property
+    def first_seen(self):
+        first_seen = self.store.first_seen[self.row]
+        return EPOCH + timedelta(seconds=first_seen) if not math.isnan(first_seen) else None
+
+    @first_seen.setter
+    def first_seen(self, first_seen):
+        self.store.first_seen[self.row] = (naive_utc(first_seen) - EPOCH).total_seconds()
+
+    @property
+    def weekly_usage(self):
+        return self.store.weekly_usage[self.row]
+
+    @weekly_usage.setter
+    def weekly_usage(self, weekly_usage):
+        self.store.weekly_usage[self.row] = weekly_usage
 
     @classmethod
-    def from_collection(cls, collection):
-        volta_meter = cls()
+    def from_collection(cls, collection, store=None):
+        volta_meter = cls(store)
         volta_meter.weekly_usage = collection['weekly_usage']
+        # documents written before first_seen was tracked leave it unknown rather than make one up
+        if collection.get('first_seen', None) is not None:
+            volta_meter.first_seen = collection['first_seen']
 
+        # documents written before state and availability were read back don't change the first transition
+        volta_meter.state = collection.get('state', None)
+        volta_meter.availability = collection.get('availability', None)
+
+        volta_meter.in_use_charging_stats.start = naive_utc(collection['in_use_charging_stats'].get('start', None))
         volta_meter.in_use_charging_stats.cnt = collection['in_use_charging_stats']['cnt']
         volta_meter.in_use_charging_stats.avg = collection['in_use_charging_stats']['avg']
 
+        volta_meter.in_use_stopped_stats.start = naive_utc(collection['in_use_stopped_stats'].get('start', None))
         volta_meter.in_use_stopped_stats.cnt = collection['in_use_stopped_stats']['cnt']
         volta_meter.in_use_stopped_stats.avg = collection['in_use_stopped_stats']['avg']
 
+        volta_meter.stale = False
+
         return volta_meter
 
-    def update(self, new_state, new_availability, timezone):
-        if not self.is_valid(self.state, self.availability):
-            if not self.is_idle(new_state, new_availability):
-                return
-        else:
+    def update(self, new_state, new_availability, timezone, codes=None):
+        store = self.store
+        row = self.row
+
+        if codes is None:
+            codes = store.codes(new_state, new_availability)
+        state_code, availability_code, new_status = codes
+
+        old_status = store.status[row]
+        if registry.enabled:
+            meter_transitions.inc(labels=self.transition_labels[old_status][new_status])
+
+        actions = self.transitions[old_status][new_status]
+        if actions & self.IGNORE:
+            return actions
+        if actions & self.TIMED:
             utc_time = DatetimeWithNanoseconds.utcnow()
 
-            self.update_in_use_charging(new_state, new_availability, utc_time)
-            self.update_in_use_stopped(new_state, new_availability, utc_time)
-            self.update_weekly_usage(new_state, new_availability, self.utc_to_local_time(utc_time, timezone))
+            self.update_in_use_charging(actions, utc_time)
+            self.update_in_use_stopped(actions, utc_time)
+            if actions & self.WEEKLY_USAGE:
+                self.update_weekly_usage(self.utc_to_local_time(utc_time, timezone))
 
-        if new_state != self.state:
+        if state_code != store.state[row]:
             logging.debug("updating meter state from {} to {}".format(self.state, new_state))
-            self.state = new_state
-            self.stale = True
-        if new_availability != self.availability:
+            store.state[row] = state_code
+            store.stale[row] = True
+        if availability_code != store.availability[row]:
             logging.debug("updating meter availability from {} to {}".format(self.availability, new_availability))
-            self.availability = new_availability
-            self.stale = True
+            store.availability[row] = availability_code
+            store.stale[row] = True
+        store.status[row] = new_status
 
-    def update_in_use_charging(self, new_state, new_availability, utc_time):
-        if not self.is_in_use(self.state, self.availability) and self.is_in_use(new_state, new_availability):
+        return actions
+
+    def update_in_use_charging(self, actions, utc_time):
+        if actions & self.CHARGING_START:
             logging.debug("updating meter in_use_charging_stats.start")
             self.in_use_charging_stats.start = utc_time
-        elif self.is_in_use(self.state, self.availability) and not self.is_in_use(new_state, new_availability):
+        elif actions & self.CHARGING_END:
             if self.in_use_charging_stats.start is not None:
                 logging.debug("updating meter in_use_charging_stats.avg")
                 self.in_use_charging_stats.update_avg(utc_time)
             else:
                 log_warning("in use charge start time is None when it should not be", self.serialize())
 
-    def update_in_use_stopped(self, new_state, new_availability, utc_time):
-        if not self.is_in_use_stopped(self.state, self.availability) and self.is_in_use_stopped(new_state, new_availability):
+    def update_in_use_stopped(self, actions, utc_time):
+        if actions & self.STOPPED_START:
             logging.debug("updating meter in_use_stopped_stats.start")
             self.in_use_stopped_stats.start = utc_time
-        elif self.is_in_use_stopped(self.state, self.availability) and not self.is_in_use_stopped(new_state, new_availability):
+        elif actions & self.STOPPED_END:
             if self.in_use_stopped_stats.start is not None:
                 logging.debug("updating meter in_use_stopped_stats.avg")
                 self.in_use_stopped_stats.update_avg(utc_time)
             else:
                 log_warning("in use idle start time is None when it should not be", self.serialize())
 
-    def update_weekly_usage(self, new_state, new_availability, local_time):
+    def update_weekly_usage(self, local_time):
         new_weekly_usage_update = (144 * local_time.weekday()) + (((local_time.hour * 60) + local_time.minute) // 10)
-        if self.is_in_use(new_state, new_availability) and new_weekly_usage_update != self.weekly_usage_update:
+        if new_weekly_usage_update != self.weekly_usage_update:
             logging.debug("updating meter weekly_usage")
             self.weekly_usage[new_weekly_usage_update] += 1
             self.weekly_usage_update = new_weekly_usage_update
 
-    def is_valid(self, state, availability):
+    @classmethod
+    def status_of(cls, state, availability):
+        if not cls.is_valid(state, availability):
+            return MeterStatus.INVALID
+        if cls.is_idle(state, availability):
+            return MeterStatus.IDLE
+        if cls.is_in_use_charging(state, availability):
+            return MeterStatus.IN_USE_CHARGING
+        if cls.is_in_use_stopped(state, availability):
+            return MeterStatus.IN_USE_STOPPED
+        return MeterStatus.OTHER
+
+    @classmethod
+    def build_transitions(cls):
+        in_use = {MeterStatus.IN_USE_CHARGING, MeterStatus.IN_USE_STOPPED}
+
+        transitions = list()
+        for old_status in MeterStatus:
+            row = list()
+            for new_status in MeterStatus:
+                actions = 0
+                if old_status == MeterStatus.INVALID:
+                    # wait for an idle meter before trusting its state
+                    if new_status != MeterStatus.IDLE:
+                        actions |= cls.IGNORE
+                else:
+                    if old_status not in in_use and new_status in in_use:
+                        actions |= cls.CHARGING_START
+                    elif old_status in in_use and new_status not in in_use:
+                        actions |= cls.CHARGING_END
+                    if old_status != MeterStatus.IN_USE_STOPPED and new_status == MeterStatus.IN_USE_STOPPED:
+                        actions |= cls.STOPPED_START
+                    elif old_status == MeterStatus.IN_USE_STOPPED and new_status != MeterStatus.IN_USE_STOPPED:
+                        actions |= cls.STOPPED_END
+                    if new_status in in_use:
+                        actions |= cls.WEEKLY_USAGE
+                row.append(actions)
+            transitions.append(row)
+
+        return transitions
+
+    @classmethod
+    def is_valid(cls, state, availability):
         return state is not None and availability is not None
     
-    def is_idle(self, state, availability):
-        return state in self.idle_states and availability in self.idle_availabilities
+    @classmethod
+    def is_idle(cls, state, availability):
+        return state in cls.idle_states and availability in cls.idle_availabilities
 
-    def is_in_use_charging(self, state, availability):
-        return state in self.in_use_charging_states and availability in self.in_use_charging_availabilities
+    @classmethod
+    def is_in_use_charging(cls, state, availability):
+        return state in cls.in_use_charging_states and availability in cls.in_use_charging_availabilities
 
-    def is_in_use_stopped(self, state, availability):
-        return state in self.in_use_stopped_states and availability in self.in_use_stopped_availabilities
+    @classmethod
+    def is_in_use_stopped(cls, state, availability):
+        return state in cls.in_use_stopped_states and availability in cls.in_use_stopped_availabilities
 
-    def is_in_use(self, state, availability):
-        return self.is_in_use_charging(state, availability) or self.is_in_use_stopped(state, availability)
+    @classmethod
+    def is_in_use(cls, state, availability):
+        return cls.is_in_use_charging(state, availability) or cls.is_in_use_stopped(state, availability)
 
     def utc_to_local_time(self, utc_time, timezone):
         return timezone.fromutc(utc_time) if timezone is not None else utc_time
@@ -152,11 +568,16 @@ class VoltaMeter:
             'availability': self.availability,
             'in_use_charging_stats': self.in_use_charging_stats.serialize(),
             'in_use_stopped_stats': self.in_use_stopped_stats.serialize(),
-            'weekly_usage': self.weekly_usage
+            'first_seen': self.first_seen,
+            'weekly_usage': self.weekly_usage.tolist()
         }
 
+VoltaMeter.transitions = VoltaMeter.build_transitions()
+
 class VoltaStation:
-    def __init__(self, name, status, street_address, city, state, zip_code, timezone):
+    field_paths = ['name', 'status', 'street_address', 'city', 'state', 'zip_code', 'timezone', 'coordinates', 'meters']
+
+    def __init__(self, name, status, street_address, city, state, zip_code, timezone, coordinates=None):
         self.name = name
         self.status = status
         self.street_address = street_address
@@ -164,6 +585,7 @@ class VoltaStation:
         self.state = state
         self.zip_code = zip_code
         self.timezone = timezone
+        self.coordinates = coordinates
 
         self.meters = dict()
         
@@ -178,14 +600,16 @@ class VoltaStation:
         state = collection['state']
         zip_code = collection['zip_code']
         zone = collection['timezone']
-        timezone = pytz.timezone(zone) if zone is not None else None
+        timezone = get_timezone(zone) if zone is not None else None
+        coordinates = collection.get('coordinates', None)
 
-        volta_station = cls(name, status, street_address, city, state, zip_code, timezone)
+        volta_station = cls(name, status, street_address, city, state, zip_code, timezone, coordinates)
         volta_station.stale = False
 
         return volta_station
 
-    def update(self, new_name, new_status, new_street_address, new_city, new_state, new_zip_code, new_timezone):
+    def update(self, new_name, new_status, new_street_address, new_city, new_state, new_zip_code, new_timezone,
+               new_coordinates):
         if new_name != self.name:
             self.name = new_name
             self.stale =  True
@@ -207,8 +631,11 @@ class VoltaStation:
         if new_timezone != self.timezone:
             self.timezone = new_timezone
             self.stale =  True
+        if new_coordinates != self.coordinates:
+            self.coordinates = new_coordinates
+            self.stale =  True
 
-    def serialize(self):
+    def serialize(self, storage):
         return {
             'name': self.name,
             'status': self.status,
@@ -217,7 +644,8 @@ class VoltaStation:
             'state': self.state,
             'zip_code': self.zip_code,
             'timezone': self.timezone.zone if self.timezone is not None else None,
-            'meters': [meters_ref.document(meter_id) for meter_id in self.meters]
+            'coordinates': self.coordinates,
+            'meters': [storage.reference('meters', meter_id) for meter_id in self.meters]
         }
 
     def poor_serialize(self):
@@ -229,17 +657,41 @@ class VoltaStation:
             'state': self.state,
             'zip_code': self.zip_code,
             'timezone': self.timezone.zone if self.timezone is not None else None,
+            'coordinates': self.coordinates,
             'meters': [meter_id for meter_id in self.meters]
         }
 
+    def index_serialize(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'meters': [meter_id for meter_id in self.meters]
+        }
+
+    def snapshot_serialize(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'street_address': self.street_address,
+            'city': self.city,
+            'state': self.state,
+            'zip_code': self.zip_code,
+            'timezone': self.timezone.zone if self.timezone is not None else None,
+            'coordinates': self.coordinates,
+            'meters': {meter_id: volta_meter.row for meter_id, volta_meter in self.meters.items()}
+        }
+
 class VoltaSite:
-    def __init__(self, name, street_address, city, state, zip_code, timezone):
+    field_paths = ['name', 'street_address', 'city', 'state', 'zip_code', 'timezone', 'coordinates', 'stations']
+
+    def __init__(self, name, street_address, city, state, zip_code, timezone, coordinates=None):
         self.name = name
         self.street_address = street_address
         self.city = city
         self.state = state
         self.zip_code = zip_code
         self.timezone = timezone
+        self.coordinates = coordinates
 
         self.stations = dict()
 
@@ -253,14 +705,15 @@ class VoltaSite:
         state = collection['state']
         zip_code = collection['zip_code']
         zone = collection['timezone']
-        timezone = pytz.timezone(zone) if zone is not None else None
+        timezone = get_timezone(zone) if zone is not None else None
+        coordinates = collection.get('coordinates', None)
 
-        volta_site = cls(name, street_address, city, state, zip_code, timezone)
+        volta_site = cls(name, street_address, city, state, zip_code, timezone, coordinates)
         volta_site.stale = False
 
         return volta_site
 
-    def update(self, new_name, new_street_address, new_city, new_state, new_zip_code, new_timezone):
+    def update(self, new_name, new_street_address, new_city, new_state, new_zip_code, new_timezone, new_coordinates):
         if new_name != self.name:
             self.name = new_name
             self.stale =  True
@@ -279,8 +732,11 @@ class VoltaSite:
         if new_timezone != self.timezone:
             self.timezone = new_timezone
             self.stale =  True
+        if new_coordinates != self.coordinates:
+            self.coordinates = new_coordinates
+            self.stale =  True
 
-    def serialize(self):
+    def serialize(self, storage):
         return {
             'name': self.name,
             'street_address': self.street_address,
@@ -288,7 +744,8 @@ class VoltaSite:
             'state': self.state,
             'zip_code': self.zip_code,
             'timezone': self.timezone.zone if self.timezone is not None else None,
-            'stations': [stations_ref.document(station_id) for station_id in self.stations]
+            'coordinates': self.coordinates,
+            'stations': [storage.reference('stations', station_id) for station_id in self.stations]
         }
 
     def poor_serialize(self):
@@ -299,23 +756,352 @@ class VoltaSite:
             'state': self.state,
             'zip_code': self.zip_code,
             'timezone': self.timezone.zone if self.timezone is not None else None,
+            'coordinates': self.coordinates,
             'stations': [station.poor_serialize() for station in self.stations.values()]
         }
 
+    def snapshot_serialize(self):
+        return {
+            'name': self.name,
+            'street_address': self.street_address,
+            'city': self.city,
+            'state': self.state,
+            'zip_code': self.zip_code,
+            'timezone': self.timezone.zone if self.timezone is not None else None,
+            'coordinates': self.coordinates,
+            'stations': {station_id: station.snapshot_serialize() for station_id, station in self.stations.items()}
+        }
+
+    def is_in_use(self):
+        for volta_station in self.stations.values():
+            for volta_meter in volta_station.meters.values():
+                if volta_meter.in_use:
+                    return True
+        return False
+
 class VoltaNetwork:
     API_URL = 'https://api.voltaapi.com/v1/public-sites'
 
-    def __init__(self, poor=False):
+    def __init__(self, poor=False, preload=False, timezone_cache_path=None, stream=False, api_url=None, change_bus=None,
+                 storage=None, write_index=True, history_dir=None, snapshot_path=None, snapshot_interval=300,
+                 owns_site=None):
         self.poor = poor
+        self.write_index = write_index
+        # sharded workers only handle, and only preload, the sites this says are theirs
+        self.owns_site = owns_site
+        self.storage = storage if storage is not None else get_storage()
+        self.stream = stream
+        self.fetcher = ApiFetcher(api_url if api_url is not None else self.API_URL)
+        self.change_bus = change_bus
 
         self.sites = dict()
-        self.tf = TimezoneFinder(in_memory=True)
+        self.meter_store = MeterStore()
+        self.timezones = TimezoneCache(timezone_cache_path)
+
+        self.write_buffer = WriteBuffer(self.storage)
+        self.history = HistoryLog(history_dir) if history_dir is not None else None
+
+        self.sites_index = SitesIndex()
+
+        self.site_fingerprints = dict()
+        self.sites_seen = 0
+        self.sites_skipped = 0
+
+        self.preloaded = False
+        self.preloaded_stations = dict()
+        self.preloaded_meters = dict()
+
+        # a snapshot already holds everything preloading would read, and the state documents don't carry
+        self.snapshot_writer = SnapshotWriter(snapshot_path, snapshot_interval) if snapshot_path is not None else None
+        restored = snapshot_path is not None and self.restore(snapshot_path)
+        if preload and not restored:
+            self.preload()
+
+    def preload_docs(self, collection, field_paths, doc_ids=None):
+        if doc_ids is None:
+            yield from self.storage.stream(collection, field_paths)
+            return
+        for i in range(0, len(doc_ids), WriteBuffer.max_batch_size):
+            yield from self.storage.get_many(collection, doc_ids[i:(i + WriteBuffer.max_batch_size)], field_paths).items()
+
+    def preload(self):
+        start = time.perf_counter()
+        reads = 0
+
+        # a shard finds the stations and meters it has to read through its own sites, rather than reading them all
+        site_collections = None
+        station_ids = None
+        meter_ids = None
+        if self.owns_site is not None:
+            site_collections = dict()
+            for site_id, collection in self.storage.stream('sites', VoltaSite.field_paths):
+                if self.owns_site(site_id):
+                    site_collections[site_id] = collection
+                reads += 1
+            if self.poor:
+                meter_ids = [
+                    meter_id
+                    for collection in site_collections.values()
+                    for station in collection['stations']
+                    for meter_id in station['meters']
+                ]
+            else:
+                station_ids = [
+                    self.storage.reference_id(station_ref)
+                    for collection in site_collections.values()
+                    for station_ref in collection['stations']
+                ]
+
+        station_collections = dict()
+        if not self.poor:
+            for station_id, collection in self.preload_docs('stations', VoltaStation.field_paths, station_ids):
+                station_collections[station_id] = collection
+                reads += 1
+            if self.owns_site is not None:
+                meter_ids = [
+                    self.storage.reference_id(meter_ref)
+                    for collection in station_collections.values()
+                    for meter_ref in collection['meters']
+                ]
+
+        meters = dict()
+        for meter_id, collection in self.preload_docs('meters', VoltaMeter.field_paths, meter_ids):
+            meters[meter_id] = VoltaMeter.from_collection(collection, self.meter_store)
+            reads += 1
+
+        # poor mode never reads sites or stations back, their documents don't carry station ids
+        stations = dict()
+        if not self.poor:
+            for station_id, collection in station_collections.items():
+                volta_station = VoltaStation.from_collection(collection)
+                for meter_ref in collection['meters']:
+                    meter_id = self.storage.reference_id(meter_ref)
+                    if meter_id in meters:
+                        volta_station.meters[meter_id] = meters[meter_id]
+                stations[station_id] = volta_station
+
+            if site_collections is None:
+                site_collections = dict()
+                for site_id, collection in self.storage.stream('sites', VoltaSite.field_paths):
+                    site_collections[site_id] = collection
+                    reads += 1
+            for site_id, collection in site_collections.items():
+                volta_site = VoltaSite.from_collection(collection)
+                for station_ref in collection['stations']:
+                    station_id = self.storage.reference_id(station_ref)
+                    if station_id in stations:
+                        volta_site.stations[station_id] = stations[station_id]
+                self.sites[site_id] = volta_site
+
+        self.preloaded = True
+        self.preloaded_stations = stations
+        self.preloaded_meters = meters
+
+        logging.info("preloaded {} sites, {} stations and {} meters with {} reads in {:.3f}s".format(
+            len(self.sites),
+            len(stations),
+            len(meters),
+            reads,
+            time.perf_counter() - start
+        ))
+
+    def capture(self):
+        header = {
+            'version': SNAPSHOT_VERSION,
+            'created': time.time(),
+            'poor': self.poor,
+            'meters': self.meter_store.size,
+            'strings': self.meter_store.strings,
+            'sites': {site_id: volta_site.snapshot_serialize() for site_id, volta_site in self.sites.items()},
+            'pending': self.write_buffer.pending_keys()
+        }
+        return header, self.meter_store.to_arrays()
+
+    def snapshot(self):
+        if self.snapshot_writer is None or not self.snapshot_writer.due():
+            return
+
+        # capturing has to happen between updates, writing it out doesn't
+        start = time.perf_counter()
+        header, arrays = self.capture()
+        self.snapshot_writer.submit(header, arrays, time.perf_counter() - start)
+
+    def restore(self, path):
+        # the restored tree is all new, long lived objects, collections while it's built would only rescan them
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.restore_snapshot(path)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def restore_snapshot(self, path):
+        start = time.perf_counter()
+        try:
+            snapshot = read_snapshot(path)
+        except Exception as e:
+            logging.exception(e)
+            return False
+        if snapshot is None:
+            return False
+
+        header, arrays = snapshot
+        if header['poor'] != self.poor:
+            logging.warning("ignoring snapshot {} taken with poor={}".format(path, header['poor']))
+            return False
+
+        store = MeterStore.from_arrays(header['strings'], arrays)
+        meters = dict()
+        stations = dict()
+        sites = dict()
+        for site_id, site_collection in header['sites'].items():
+            volta_site = VoltaSite.from_collection(site_collection)
+            for station_id, station_collection in site_collection['stations'].items():
+                volta_station = VoltaStation.from_collection(station_collection)
+                for meter_id, row in station_collection['meters'].items():
+                    volta_meter = VoltaMeter(store, row)
+                    volta_station.meters[meter_id] = volta_meter
+                    meters[meter_id] = volta_meter
+                volta_site.stations[station_id] = volta_station
+                stations[station_id] = volta_station
+            sites[site_id] = volta_site
+
+        self.meter_store = store
+        self.sites = sites
+        for site_id, volta_site in sites.items():
+            self.sites_index.update(site_id, volta_site)
+
+        # writes that weren't known to be committed when the snapshot was captured are queued again
+        for collection, doc_id in header['pending']:
+            if collection == 'meters' and doc_id in meters:
+                self.write_buffer.set(collection, doc_id, meters[doc_id].serialize())
+            elif collection == 'stations' and doc_id in stations:
+                self.write_buffer.set(collection, doc_id, stations[doc_id].serialize(self.storage))
+            elif collection == 'sites' and doc_id in sites:
+                if self.poor:
+                    self.write_buffer.set(collection, doc_id, sites[doc_id].poor_serialize())
+                else:
+                    self.write_buffer.set(collection, doc_id, sites[doc_id].serialize(self.storage))
+
+        restore_time = time.perf_counter() - start
+        if registry.enabled:
+            snapshot_seconds.observe(restore_time, ('restore',))
+        logging.info("restored {} sites, {} stations and {} meters from a {:.0f}s old snapshot in {:.3f}s, requeued {} writes".format(
+            len(sites),
+            len(stations),
+            len(meters),
+            time.time() - header['created'],
+            restore_time,
+            len(self.write_buffer)
+        ))
+        return True
 
     def update(self):
-        with urlopen(self.API_URL) as url:
-            data = json.loads(url.read().decode())
-            for site in data:
-                self.parse_site(site)
+        if self.stream:
+            self.fetch_parse()
+        else:
+            self.parse(self.fetch())
+        self.persist()
+
+    def fetch_parse(self):
+        # sites are parsed straight off the response, the payload is never held whole
+        with self.fetcher.open() as f:
+            if f is not None:
+                # fetching and decoding are interleaved with parsing here, so it all counts as parse
+                with update_seconds.time(('parse',)):
+                    self.parse_sites(iter_array(f))
+            else:
+                self.tick()
+
+    def fetch(self):
+        with update_seconds.time(('fetch',)):
+            return self.fetcher.fetch()
+
+    def parse(self, payload):
+        if payload is None:
+            self.tick()
+        elif self.stream:
+            with update_seconds.time(('parse',)):
+                self.parse_sites(iter_array(io.BytesIO(payload)))
+        else:
+            with update_seconds.time(('decode',)):
+                sites = json.loads(payload.decode())
+            with update_seconds.time(('parse',)):
+                self.parse_sites(sites)
+
+    def parse_sites(self, sites):
+        self.write_buffer.reset_stats()
+        self.sites_seen = 0
+        self.sites_skipped = 0
+        self.timezones.reset_stats()
+
+        for site in sites:
+            self.parse_site(site)
+
+        # anything not claimed by the first cycle is gone from the network, what shows up later is read back
+        # from storage like it would have been without preloading, so it doesn't come back with empty history
+        self.preloaded = False
+        self.preloaded_stations.clear()
+        self.preloaded_meters.clear()
+
+        if self.write_index and self.sites_index.dirty:
+            logging.debug("writing sites index to indexes")
+            self.sites_index.write(self.write_buffer)
+
+        if self.sites_seen:
+            logging.info("skipped {} of {} unchanged sites ({:.1%})".format(
+                self.sites_skipped,
+                self.sites_seen,
+                self.sites_skipped / self.sites_seen
+            ))
+
+        if registry.enabled:
+            sites_parsed.inc(self.sites_seen - self.sites_skipped, ('changed',))
+            sites_parsed.inc(self.sites_skipped, ('unchanged',))
+            timezone_lookups.inc(self.timezones.hits, ('hit',))
+            timezone_lookups.inc(self.timezones.misses, ('miss',))
+
+        if self.timezones.hits or self.timezones.misses:
+            logging.info("timezone cache hit rate {:.1%}, saved {:.3f}s".format(
+                self.timezones.hit_rate,
+                self.timezones.time_saved
+            ))
+        self.timezones.save()
+
+        self.snapshot()
+
+    def tick(self):
+        # nothing changed upstream, but in use meters still have to advance their weekly_usage bucket
+        with update_seconds.time(('tick',)):
+            for volta_site in self.sites.values():
+                for volta_station in volta_site.stations.values():
+                    for volta_meter in volta_station.meters.values():
+                        if volta_meter.in_use:
+                            volta_meter.update(volta_meter.state, volta_meter.availability, volta_station.timezone)
+        self.snapshot()
+
+    def persist(self):
+        with update_seconds.time(('persist',)):
+            self.write_buffer.flush()
+            if self.history is not None:
+                self.history.flush()
+        logging.info("wrote {} docs ({} queued) in {} batches in {:.3f}s".format(
+            self.write_buffer.docs_written,
+            self.write_buffer.docs_queued,
+            self.write_buffer.batches,
+            self.write_buffer.flush_latency
+        ))
+
+    def close(self):
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.close()
+
+    def read(self, collection, doc_id, field_paths):
+        if registry.enabled:
+            storage_reads.inc(labels=(collection,))
+        with storage_read_seconds.time((collection,)):
+            return self.storage.get(collection, doc_id, field_paths)
 
     def parse_site(self, site):
         site_id = site.get('id', None)
@@ -323,49 +1109,66 @@ class VoltaNetwork:
             log_warning("site 'id' not found", site)
             return
 
+        self.sites_seen += 1
+        fingerprint = hash(json.dumps(site, separators=(',', ':')))
+        if self.site_fingerprints.get(site_id, None) == fingerprint:
+            self.sites_skipped += 1
+            return
+
         name = site.get('name', None)
         street_address = site.get('street_address', None)
         city = site.get('city', None)
         state = site.get('state', None)
         zip_code = int(site['zip_code']) if 'zip_code' in site else None
-        timezone = self.find_timezone(site)
+        coordinates = self.find_coordinates(site)
+        timezone = self.find_timezone(coordinates)
 
         volta_site = self.sites.get(site_id, None)
         if volta_site is None:
-            if not self.poor:
-                field_paths = ['name', 'street_address', 'city', 'state', 'zip_code', 'timezone', 'stations']
-                collection = sites_ref.document(site_id).get(field_paths).to_dict()
+            if not self.poor and not self.preloaded:
+                collection = self.read('sites', site_id, VoltaSite.field_paths)
                 if collection is not None:
                     volta_site = VoltaSite.from_collection(collection)
 
             if volta_site is None:
                 logging.info("creating new site {}".format(site_id))
-                volta_site = VoltaSite(name, street_address, city, state, zip_code, timezone)
+                volta_site = VoltaSite(name, street_address, city, state, zip_code, timezone, coordinates)
 
             self.sites[site_id] = volta_site
 
-        volta_site.update(name, street_address, city, state, zip_code, timezone)
+        volta_site.update(name, street_address, city, state, zip_code, timezone, coordinates)
+        index_stale = volta_site.stale or site_id not in self.sites_index
 
         stations = site.get('stations', None)
         if stations is not None:
             for station in stations:
-                self.parse_station(volta_site, station)
+                if self.parse_station(volta_site, station):
+                    index_stale = True
         else:
             log_warning("'stations' array not found", site)
 
+        if index_stale:
+            self.sites_index.update(site_id, volta_site)
+
         if volta_site.stale:
-            logging.debug("writing site {} to sites_ref".format(site_id))
+            logging.debug("writing site {} to sites".format(site_id))
             if self.poor:
-                sites_ref.document(site_id).set(volta_site.poor_serialize())
+                self.write_buffer.set('sites', site_id, volta_site.poor_serialize())
             else:
-                sites_ref.document(site_id).set(volta_site.serialize())
+                self.write_buffer.set('sites', site_id, volta_site.serialize(self.storage))
             volta_site.stale = False
 
+        # in use meters still need their weekly_usage bucket advanced while the payload stands still
+        if volta_site.is_in_use():
+            self.site_fingerprints.pop(site_id, None)
+        else:
+            self.site_fingerprints[site_id] = fingerprint
+
     def parse_station(self, volta_site, station):
         station_id = station.get('id', None)
         if station_id is None:
             log_warning("station 'id' not found", station)
-            return
+            return False
 
         name = station.get('name', None)
         status = station.get('status', None)
@@ -373,23 +1176,25 @@ class VoltaNetwork:
         city = station.get('city', None)
         state = station.get('state', None)
         zip_code = int(station['zip_code']) if 'zip_code' in station else None
-        timezone = self.find_timezone(station)
+        coordinates = self.find_coordinates(station)
+        timezone = self.find_timezone(coordinates)
 
         volta_station = volta_site.stations.get(station_id, None)
         if volta_station is None:
-            if not self.poor:
-                field_paths = ['name', 'status', 'street_address', 'city', 'state', 'zip_code', 'timezone', 'meters']
-                collection = stations_ref.document(station_id).get(field_paths).to_dict()
+            if self.preloaded:
+                volta_station = self.preloaded_stations.pop(station_id, None)
+            elif not self.poor:
+                collection = self.read('stations', station_id, VoltaStation.field_paths)
                 if collection is not None:
                     volta_station = VoltaStation.from_collection(collection)
 
             if volta_station is None:
                 logging.info("creating new station {}".format(station_id))
-                volta_station = VoltaStation(name, status, street_address, city, state, zip_code, timezone)
+                volta_station = VoltaStation(name, status, street_address, city, state, zip_code, timezone, coordinates)
 
             volta_site.stations[station_id] = volta_station
 
-        volta_station.update(name, status, street_address, city, state, zip_code, timezone)
+        volta_station.update(name, status, street_address, city, state, zip_code, timezone, coordinates)
 
         meters = station.get('meters', None)
         if meters is not None:
@@ -398,14 +1203,17 @@ class VoltaNetwork:
         else:
             log_warning("'meters' array not found", station)
 
+        stale = volta_station.stale
         if volta_station.stale:
             if self.poor:
                 volta_site.stale = True
             else:
-                logging.debug("writing station {} to stations_ref".format(station_id))
-                stations_ref.document(station_id).set(volta_station.serialize())
+                logging.debug("writing station {} to stations".format(station_id))
+                self.write_buffer.set('stations', station_id, volta_station.serialize(self.storage))
             volta_station.stale = False
 
+        return stale
+
     def parse_meter(self, volta_station, meter):
         meter_id = meter.get('oem_id', None)
         if meter_id is None:
@@ -417,38 +1225,69 @@ class VoltaNetwork:
 
         volta_meter = volta_station.meters.get(meter_id, None)
         if volta_meter is None:
-            field_paths = ['weekly_usage', 'in_use_charging_stats', 'in_use_stopped_stats']
-            collection = meters_ref.document(meter_id).get(field_paths).to_dict()
-            if collection is not None:
-                volta_meter = VoltaMeter.from_collection(collection)
+            if self.preloaded:
+                volta_meter = self.preloaded_meters.pop(meter_id, None)
             else:
+                collection = self.read('meters', meter_id, VoltaMeter.field_paths)
+                if collection is not None:
+                    volta_meter = VoltaMeter.from_collection(collection, self.meter_store)
+
+            if volta_meter is None:
                 logging.info("creating new meter {}".format(meter_id))
-                volta_meter = VoltaMeter()
+                volta_meter = VoltaMeter(self.meter_store)
+                volta_meter.first_seen = DatetimeWithNanoseconds.utcnow()
 
             volta_station.meters[meter_id] = volta_meter
+            volta_station.stale = True
 
-        volta_meter.update(state, availability, volta_station.timezone)
+        codes = self.meter_store.codes(state, availability)
+        if self.history is None:
+            volta_meter.update(state, availability, volta_station.timezone, codes)
+        else:
+            # a session's start is cleared by the update that ends it, so hold on to it for the log
+            old_status = self.meter_store.status[volta_meter.row]
+            charging_start = volta_meter.in_use_charging_stats.start
+            stopped_start = volta_meter.in_use_stopped_stats.start
+
+            actions = volta_meter.update(state, availability, volta_station.timezone, codes)
+            if not actions & VoltaMeter.IGNORE:
+                self.history.record(
+                    meter_id,
+                    old_status,
+                    self.meter_store.status[volta_meter.row],
+                    charging_start if actions & VoltaMeter.CHARGING_END else None,
+                    stopped_start if actions & VoltaMeter.STOPPED_END else None
+                )
         if volta_meter.stale:
-            logging.debug("writing meter {} to meters_ref".format(meter_id))
-            meters_ref.document(meter_id).set(volta_meter.serialize())
+            logging.debug("writing meter {} to meters".format(meter_id))
+            data = volta_meter.serialize()
+            self.write_buffer.set('meters', meter_id, data)
+            if self.change_bus is not None:
+                self.change_bus.publish(meter_id, data)
             volta_meter.stale = False
 
-    def find_timezone(self, station):
+    def find_coordinates(self, station):
         location = station.get('location', None)
         if location is not None:
             coordinates = location.get('coordinates', None)
             if coordinates is not None:
-                timezone = self.tf.timezone_at(lng=coordinates[0], lat=coordinates[1])
-                if timezone is not None:
-                    try:
-                        return pytz.timezone(timezone)
-                    except Exception as e:
-                        logging.exception(e)
-                else:
-                    log_warning("timezone not found", coordinates)
+                return [coordinates[0], coordinates[1]]
             else:
                 log_warning("'coordinates' array not found", location)
         else:
             log_warning("'location' object not found", station)
 
         return None
+
+    def find_timezone(self, coordinates):
+        if coordinates is not None:
+            timezone = self.timezones.zone_at(coordinates[0], coordinates[1])
+            if timezone is not None:
+                try:
+                    return get_timezone(timezone)
+                except Exception as e:
+                    logging.exception(e)
+            else:
+                log_warning("timezone not found", coordinates)
+
+        return None
@@ -0,0 +1,242 @@
+from datetime import datetime, timezone
+import threading
+import time
+
+import numpy as np
+
+from volta_plus.history import utc_timestamp
+from volta_plus.timezones import get_timezone
+
+
+WEEKLY_USAGE_BUCKETS = 144 * 7
+WEEK_SECONDS = 7 * 24 * 3600
+
+
+def current_bucket(zone, utc_time=None):
+    if utc_time is None:
+        utc_time = datetime.now(timezone.utc)
+    local_time = utc_time.astimezone(get_timezone(zone)) if zone is not None else utc_time
+    return (144 * local_time.weekday()) + (((local_time.hour * 60) + local_time.minute) // 10)
+
+
+def segment_sums(values, offsets, sizes):
+    # reduceat can't express an empty segment, but skipping them leaves every other segment's bounds intact
+    sums = np.zeros((len(offsets),) + values.shape[1:], dtype=np.float64)
+    nonempty = sizes > 0
+    if nonempty.any():
+        sums[nonempty] = np.add.reduceat(values, offsets[nonempty], axis=0, dtype=np.float64)
+    return sums
+
+
+class OccupancyEngine:
+    def __init__(self, storage, chunk_size=500, rates_ttl=3600, network_epoch=None):
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.rates_ttl = rates_ttl
+        # meters from before first_seen was tracked are taken as observed since the network came up, if that's known
+        self.network_epoch = utc_timestamp(network_epoch) if network_epoch is not None else np.nan
+        self.lock = threading.Lock()
+        self.etag = None
+
+        # meters are ordered by site and then station, so every station and site is a contiguous run of rows
+        self.meter_rows = dict()
+        self.usage = np.zeros((0, WEEKLY_USAGE_BUCKETS), dtype=np.uint16)
+        self.first_seen = np.zeros(0, dtype=np.float64)
+        self.rates = np.zeros((0, WEEKLY_USAGE_BUCKETS), dtype=np.float32)
+        self.rates_time = 0
+        self.meter_stations = np.zeros(0, dtype=np.intp)
+
+        self.station_ids = list()
+        self.station_sizes = np.zeros(0, dtype=np.intp)
+        self.station_offsets = np.zeros(0, dtype=np.intp)
+        self.station_sites = np.zeros(0, dtype=np.intp)
+        self.station_sums = np.zeros((0, WEEKLY_USAGE_BUCKETS), dtype=np.float64)
+
+        self.site_rows = dict()
+        self.site_zones = list()
+        self.site_stations = list()
+        self.site_sizes = np.zeros(0, dtype=np.intp)
+        self.site_station_counts = np.zeros(0, dtype=np.intp)
+        self.site_offsets = np.zeros(0, dtype=np.intp)
+        self.site_sums = np.zeros((0, WEEKLY_USAGE_BUCKETS), dtype=np.float64)
+
+        self.rebuild_time = 0
+
+    @staticmethod
+    def usage_rates(usage, first_seen, now, epoch=np.nan):
+        # a bucket comes round once a week, so a meter's weeks observed is how often each bucket could have been counted,
+        # the busiest bucket bounds that from below for meters whose first_seen is unknown (nan) or came too late
+        first_seen = np.where(np.isnan(first_seen), epoch, first_seen)
+        weeks = np.fmax((now - first_seen) / WEEK_SECONDS, usage.max(axis=1))
+        weeks = np.maximum(weeks, 1)
+        return (usage / weeks[:, np.newaxis]).astype(np.float32)
+
+    @staticmethod
+    def first_seen_of(meter):
+        first_seen = meter.get('first_seen', None)
+        return utc_timestamp(first_seen) if first_seen is not None else np.nan
+
+    def sums(self, rates, station_offsets, station_sizes, site_offsets, site_station_counts):
+        station_sums = segment_sums(rates, station_offsets, station_sizes)
+        return station_sums, segment_sums(station_sums, site_offsets, site_station_counts)
+
+    def rebuild(self, locations, etag):
+        start = time.perf_counter()
+
+        sites = dict()
+        for location in locations:
+            sites.setdefault(location['site_id'], list()).append(location)
+
+        meter_ids = list()
+        meter_stations = list()
+        station_ids = list()
+        station_sizes = list()
+        station_sites = list()
+        site_rows = dict()
+        site_zones = list()
+        site_stations = list()
+        site_sizes = list()
+        for site_row, (site_id, stations) in enumerate(sites.items()):
+            site_rows[site_id] = site_row
+            site_zones.append(next((station.get('timezone', None) for station in stations if station.get('timezone', None)), None))
+            site_stations.append(range(len(station_ids), len(station_ids) + len(stations)))
+            site_sizes.append(sum(len(station['meters']) for station in stations))
+            for station in stations:
+                meter_stations.extend([len(station_ids)] * len(station['meters']))
+                meter_ids.extend(station['meters'])
+                station_ids.append(station['station_id'])
+                station_sizes.append(len(station['meters']))
+                station_sites.append(site_row)
+
+        # histograms already loaded are kept, only meters new to the index are read
+        usage = np.zeros((len(meter_ids), WEEKLY_USAGE_BUCKETS), dtype=np.uint16)
+        first_seen = np.full(len(meter_ids), np.nan, dtype=np.float64)
+        missing = list()
+        with self.lock:
+            for row, meter_id in enumerate(meter_ids):
+                old_row = self.meter_rows.get(meter_id, None)
+                if old_row is not None:
+                    usage[row] = self.usage[old_row]
+                    first_seen[row] = self.first_seen[old_row]
+                else:
+                    missing.append(row)
+        for i in range(0, len(missing), self.chunk_size):
+            rows = missing[i:(i + self.chunk_size)]
+            found = self.storage.get_many('meters', [meter_ids[row] for row in rows], ['weekly_usage', 'first_seen'])
+            for row in rows:
+                meter = found.get(meter_ids[row], None)
+                if meter is not None:
+                    usage[row] = meter['weekly_usage']
+                    first_seen[row] = self.first_seen_of(meter)
+
+        now = time.time()
+        rates = self.usage_rates(usage, first_seen, now, self.network_epoch)
+        station_sizes = np.array(station_sizes, dtype=np.intp)
+        station_offsets = np.concatenate(([0], np.cumsum(station_sizes)[:-1])).astype(np.intp)
+        site_station_counts = np.array([len(stations) for stations in site_stations], dtype=np.intp)
+        site_offsets = np.array([stations.start for stations in site_stations], dtype=np.intp)
+        station_sums, site_sums = self.sums(rates, station_offsets, station_sizes, site_offsets, site_station_counts)
+
+        with self.lock:
+            self.meter_rows = {meter_id: row for row, meter_id in enumerate(meter_ids)}
+            self.usage = usage
+            self.first_seen = first_seen
+            self.rates = rates
+            self.rates_time = now
+            self.meter_stations = np.array(meter_stations, dtype=np.intp)
+            self.station_ids = station_ids
+            self.station_sizes = station_sizes
+            self.station_offsets = station_offsets
+            self.station_sites = np.array(station_sites, dtype=np.intp)
+            self.station_sums = station_sums
+            self.site_rows = site_rows
+            self.site_zones = site_zones
+            self.site_stations = site_stations
+            self.site_sizes = np.array(site_sizes, dtype=np.intp)
+            self.site_station_counts = site_station_counts
+            self.site_offsets = site_offsets
+            self.site_sums = site_sums
+            self.etag = etag
+
+        self.rebuild_time = time.perf_counter() - start
+
+    def update_meter(self, meter_id, weekly_usage, first_seen=np.nan):
+        with self.lock:
+            row = self.meter_rows.get(meter_id, None)
+            if row is None:
+                return
+
+            self.usage[row] = weekly_usage
+            if not np.isnan(first_seen):
+                self.first_seen[row] = first_seen
+            rates = self.usage_rates(
+                self.usage[row:(row + 1)],
+                self.first_seen[row:(row + 1)],
+                self.rates_time,
+                self.network_epoch
+            )[0]
+            delta = rates - self.rates[row]
+            self.rates[row] = rates
+
+            # only the sums the meter belongs to move, nothing is recomputed from scratch
+            station = self.meter_stations[row]
+            self.station_sums[station] += delta
+            self.site_sums[self.station_sites[station]] += delta
+
+    def refresh_rates(self):
+        # every rate falls as its meter is observed for longer, so they're all recomputed once they're rates_ttl old
+        now = time.time()
+        with self.lock:
+            if now - self.rates_time < self.rates_ttl:
+                return
+            self.rates = self.usage_rates(self.usage, self.first_seen, now, self.network_epoch)
+            self.station_sums, self.site_sums = self.sums(
+                self.rates, self.station_offsets, self.station_sizes, self.site_offsets, self.site_station_counts
+            )
+            self.rates_time = now
+
+    def busy_now(self, utc_time=None):
+        self.refresh_rates()
+        with self.lock:
+            if not self.site_rows:
+                return dict()
+
+            # one bucket lookup per timezone, then every site's current bucket is read in a single gather
+            buckets = {zone: current_bucket(zone, utc_time) for zone in set(self.site_zones)}
+            site_buckets = np.array([buckets[zone] for zone in self.site_zones], dtype=np.intp)
+            busy = self.site_sums[np.arange(len(site_buckets)), site_buckets] / np.maximum(self.site_sizes, 1)
+
+            return {site_id: float(busy[site_row]) for site_id, site_row in self.site_rows.items()}
+
+    def occupancy(self, site_ids, profile=False, utc_time=None):
+        self.refresh_rates()
+        occupancies = dict()
+        with self.lock:
+            for site_id in site_ids:
+                site_row = self.site_rows.get(site_id, None)
+                if site_row is None:
+                    occupancies[site_id] = None
+                    continue
+
+                # expected fraction of the site's meters in use, per 10 minute bucket of the week
+                bucket = current_bucket(self.site_zones[site_row], utc_time)
+                stations = self.site_stations[site_row]
+                sizes = np.maximum(self.station_sizes[stations.start:stations.stop], 1)
+                station_busy = self.station_sums[stations.start:stations.stop, bucket] / sizes
+
+                occupancy = {
+                    'bucket': bucket,
+                    'busy': float(self.site_sums[site_row, bucket] / max(self.site_sizes[site_row], 1)),
+                    'meters': int(self.site_sizes[site_row]),
+                    'stations': [
+                        {'id': self.station_ids[station], 'busy': float(busy), 'meters': int(self.station_sizes[station])}
+                        for station, busy in zip(stations, station_busy)
+                    ]
+                }
+                if profile:
+                    occupancy['profile'] = np.round(
+                        self.site_sums[site_row] / max(self.site_sizes[site_row], 1), 3
+                    ).reshape(7, 144).tolist()
+                occupancies[site_id] = occupancy
+
+        return occupancies
@@ -0,0 +1,187 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from volta_plus.metrics import registry
+
+
+missed_ticks = registry.counter('volta_poller_missed_ticks_total', "fetch ticks skipped because a fetch overran")
+dropped_payloads = registry.counter('volta_poller_dropped_payloads_total', "payloads superseded before they were parsed")
+
+
+class StageStats:
+    def __init__(self):
+        self.cnt = 0
+        self.last = 0
+        self.avg = 0
+        self.max = 0
+
+    def record(self, latency):
+        self.cnt += 1
+        self.last = latency
+        self.avg += (latency - self.avg) / self.cnt
+        self.max = max(self.max, latency)
+
+
+class Poller:
+    stages = ('fetch', 'parse', 'persist')
+
+    def __init__(self, volta_network, interval=15, queue_size=1, metrics_path=None, metrics_interval=60):
+        self.volta_network = volta_network
+        self.interval = interval
+
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.metrics_dumped = time.monotonic()
+
+        # fetched payloads waiting to be parsed, and flush requests waiting on the writer
+        self.payloads = queue.Queue(maxsize=queue_size)
+        self.flushes = queue.Queue(maxsize=1)
+
+        self.stopped = threading.Event()
+        self.threads = list()
+
+        self.stats = {stage: StageStats() for stage in self.stages}
+        self.missed_ticks = 0
+        self.dropped_payloads = 0
+
+    def start(self):
+        # a streamed payload is parsed while it's read, so the fetch thread does both and there's no parse thread
+        targets = (self.persist_loop,) if self.volta_network.stream else (self.parse_loop, self.persist_loop)
+        for target in targets:
+            thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        self.start()
+        self.fetch_loop()
+
+    def fetch_loop(self):
+        next_tick = time.monotonic()
+        while not self.stopped.is_set():
+            if self.volta_network.stream:
+                self.fetch_parse()
+            else:
+                self.fetch()
+
+            # stay on a fixed rate clock, ticks that already passed are skipped rather than bunched up
+            next_tick += self.interval
+            now = time.monotonic()
+            if now >= next_tick:
+                missed = int((now - next_tick) // self.interval) + 1
+                self.missed_ticks += missed
+                if registry.enabled:
+                    missed_ticks.inc(missed)
+                next_tick += missed * self.interval
+                logging.warning("fetch fell behind, missed {} ticks".format(missed))
+
+            self.stopped.wait(next_tick - now)
+
+    def fetch(self):
+        start = time.monotonic()
+        try:
+            payload = self.volta_network.fetch()
+        except Exception as e:
+            logging.exception(e)
+        else:
+            # None means not modified, which is only worth parsing when no newer payload is waiting
+            if payload is not None or self.payloads.empty():
+                self.offer(payload)
+        self.stats['fetch'].record(time.monotonic() - start)
+
+    def fetch_parse(self):
+        start = time.monotonic()
+        try:
+            self.volta_network.fetch_parse()
+        except Exception as e:
+            logging.exception(e)
+        self.stats['parse'].record(time.monotonic() - start)
+        self.request_flush()
+
+    def offer(self, payload):
+        # a newer payload supersedes one that hasn't been parsed yet
+        while True:
+            try:
+                self.payloads.put_nowait(payload)
+                return
+            except queue.Full:
+                try:
+                    self.payloads.get_nowait()
+                    self.dropped_payloads += 1
+                    if registry.enabled:
+                        dropped_payloads.inc()
+                    logging.warning("parse fell behind, dropped an unparsed payload")
+                except queue.Empty:
+                    pass
+
+    def parse_loop(self):
+        while not self.stopped.is_set():
+            try:
+                payload = self.payloads.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+
+            start = time.monotonic()
+            try:
+                self.volta_network.parse(payload)
+            except Exception as e:
+                logging.exception(e)
+            self.stats['parse'].record(time.monotonic() - start)
+            self.request_flush()
+
+    def request_flush(self):
+        # the writer drains the whole buffer, so one outstanding flush request is enough
+        try:
+            self.flushes.put_nowait(True)
+        except queue.Full:
+            pass
+
+    def persist_loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.flushes.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+
+            start = time.monotonic()
+            try:
+                self.volta_network.persist()
+            except Exception as e:
+                logging.exception(e)
+            self.stats['persist'].record(time.monotonic() - start)
+
+            self.log_stats()
+            self.dump_metrics()
+
+    def log_stats(self):
+        logging.info("{}, missed {} ticks, dropped {} payloads".format(
+            ", ".join("{} {:.3f}s (avg {:.3f}s, max {:.3f}s)".format(
+                stage,
+                self.stats[stage].last,
+                self.stats[stage].avg,
+                self.stats[stage].max
+            ) for stage in self.stages),
+            self.missed_ticks,
+            self.dropped_payloads
+        ))
+
+    def dump_metrics(self):
+        if not registry.enabled or time.monotonic() - self.metrics_dumped < self.metrics_interval:
+            return
+        self.metrics_dumped = time.monotonic()
+
+        if self.metrics_path is None:
+            logging.info("metrics\n{}".format(registry.render()))
+            return
+
+        # written atomically so a textfile collector never scrapes half a file
+        tmp_path = '{}.tmp'.format(self.metrics_path)
+        with open(tmp_path, 'w') as f:
+            f.write(registry.render())
+        os.replace(tmp_path, self.metrics_path)
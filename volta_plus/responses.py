@@ -0,0 +1,52 @@
+from datetime import datetime
+import gzip
+import json
+
+from flask import Response
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def default(value):
+    # the same rfc 822 dates flask's encoder writes for InUseStats.start
+    if isinstance(value, datetime):
+        return http_date(value)
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+if orjson is not None:
+    _options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=default, option=_options)
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=default, sort_keys=True, separators=(',', ':')).encode()
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def compress(payload, gzip_level=6, brotli_quality=9):
+    # done once per payload version, so it's worth a slower, tighter setting than per request compression
+    encodings = {'gzip': gzip.compress(payload, gzip_level)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(payload, quality=brotli_quality)
+    return encodings
+
+
+def negotiate(request, payload, encodings):
+    for encoding in ('br', 'gzip'):
+        if encoding in encodings and request.accept_encodings.quality(encoding) > 0:
+            return encoding, encodings[encoding]
+    return None, payload
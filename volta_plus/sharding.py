@@ -0,0 +1,272 @@
+import json
+import logging
+from logging.handlers import TimedRotatingFileHandler
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+
+from volta_plus.fetch import ApiFetcher
+from volta_plus.index import SitesIndex
+from volta_plus.metrics import registry
+from volta_plus.models import VoltaNetwork, WriteBuffer, log_warning, update_seconds
+from volta_plus.storage import create_storage
+from volta_plus.streaming import iter_array
+
+
+shard_lag = registry.gauge('volta_shard_lag_seconds', "time from handing a shard its sites to it having persisted them", ('shard',))
+shard_sites = registry.gauge('volta_shard_sites', "sites handed to a shard in the last cycle", ('shard',))
+shard_writes = registry.gauge('volta_shard_writes', "documents a shard wrote in the last cycle", ('shard',))
+
+
+# a task payload saying the cycle's sites follow on the task queue in batches, ended by an empty batch
+STREAMED = 'streamed'
+
+
+def shard_of(site_id, shards):
+    # crc32 rather than hash() so every process and every restart agrees on the owner
+    return zlib.crc32(site_id.encode()) % shards
+
+
+def iter_batches(tasks):
+    while True:
+        batch = tasks.get()
+        if not batch:
+            return
+        yield from batch
+
+
+def run_worker(shard, shards, tasks, results, storage_url, timezone_cache_path, history_dir, snapshot_path, network_kwargs,
+               log_path=None, metrics=False):
+    # a spawned worker starts with a fresh registry and whatever logging importing the main script set up,
+    # so both are set up again here, each shard logging to its own file
+    handlers = None
+    if log_path is not None:
+        root, ext = os.path.splitext(log_path)
+        log_path = '{}.shard-{}{}'.format(root, shard, ext)
+        handlers = [TimedRotatingFileHandler(log_path, when='midnight', backupCount=3, utc=True)]
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='[%(levelname)s][%(asctime)s][shard {}] %(message)s'.format(shard),
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=handlers,
+        force=True
+    )
+
+    if metrics:
+        registry.enable()
+
+    if timezone_cache_path is not None:
+        timezone_cache_path = '{}.{}'.format(timezone_cache_path, shard)
+    if history_dir is not None:
+        history_dir = os.path.join(history_dir, 'shard-{}'.format(shard))
+    if snapshot_path is not None:
+        snapshot_path = '{}.{}'.format(snapshot_path, shard)
+
+    # the storage client is created here, clients don't survive being handed across processes
+    volta_network = VoltaNetwork(
+        storage=create_storage(storage_url),
+        timezone_cache_path=timezone_cache_path,
+        history_dir=history_dir,
+        snapshot_path=snapshot_path,
+        write_index=False,
+        owns_site=lambda site_id: shard_of(site_id, shards) == shard,
+        **network_kwargs
+    )
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            volta_network.close()
+            return
+
+        cycle, payload = task
+        result = {'shard': shard, 'cycle': cycle, 'sites': 0, 'writes': 0, 'index': dict(), 'error': None}
+        sites = iter_batches(tasks) if payload == STREAMED else None
+        try:
+            if sites is not None:
+                with update_seconds.time(('parse',)):
+                    volta_network.parse_sites(sites)
+            else:
+                volta_network.parse(payload)
+            volta_network.persist()
+
+            result['sites'] = volta_network.sites_seen
+            result['writes'] = volta_network.write_buffer.docs_written
+            result['index'] = volta_network.sites_index.take_changes()
+        except Exception as e:
+            logging.exception(e)
+            result['error'] = repr(e)
+            # the rest of a streamed cycle is still on the queue, it mustn't be taken for the next tasks
+            if sites is not None:
+                for _ in sites:
+                    pass
+        results.put(result)
+
+
+class ShardedNetwork:
+    def __init__(self, shards, storage_url='firestore', poor=False, preload=False, timezone_cache_path=None,
+                 stream=False, api_url=None, history_dir=None, snapshot_path=None, snapshot_interval=300, timeout=60,
+                 log_path=None):
+        self.shards = shards
+        self.stream = stream
+        self.timeout = timeout
+        self.restarts = 0
+        self.fetcher = ApiFetcher(api_url if api_url is not None else VoltaNetwork.API_URL)
+
+        self.storage = create_storage(storage_url)
+        self.write_buffer = WriteBuffer(self.storage)
+        self.sites_index = SitesIndex()
+
+        self.cycle = 0
+        self.lag = [0] * shards
+
+        # spawned rather than forked so no storage client or lock is inherited half initialized
+        self.ctx = multiprocessing.get_context('spawn')
+        self.results = self.ctx.Queue()
+        self.worker_args = (
+            storage_url, timezone_cache_path, history_dir, snapshot_path,
+            {'poor': poor, 'preload': preload, 'stream': stream, 'snapshot_interval': snapshot_interval},
+            log_path, registry.enabled
+        )
+        self.tasks = [None] * shards
+        self.workers = [None] * shards
+        for shard in range(shards):
+            self.start_worker(shard)
+
+    def start_worker(self, shard):
+        # a fresh queue, whatever a dead worker left on its old one belongs to a cycle that's already given up on
+        self.tasks[shard] = self.ctx.Queue()
+        worker = self.ctx.Process(
+            target=run_worker,
+            args=(shard, self.shards, self.tasks[shard], self.results) + self.worker_args,
+            name='shard-{}'.format(shard),
+            daemon=True
+        )
+        worker.start()
+        self.workers[shard] = worker
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def fetch(self):
+        with update_seconds.time(('fetch',)):
+            return self.fetcher.fetch()
+
+    def partition(self, payload):
+        with update_seconds.time(('decode',)):
+            sites = json.loads(payload.decode())
+
+        partitions = [list() for _ in range(self.shards)]
+        for site in sites:
+            site_id = site.get('id', None)
+            if site_id is None:
+                log_warning("site 'id' not found", site)
+                continue
+            partitions[shard_of(site_id, self.shards)].append(site)
+
+        # workers parse bytes through the same path as a single VoltaNetwork
+        return [json.dumps(partition).encode() for partition in partitions]
+
+    def parse(self, payload):
+        self.cycle += 1
+
+        # None means not modified, every shard still has to tick its in use meters
+        partitions = self.partition(payload) if payload is not None else [None] * self.shards
+
+        start = time.monotonic()
+        with update_seconds.time(('parse',)):
+            for shard, partition in enumerate(partitions):
+                self.tasks[shard].put((self.cycle, partition))
+            self.collect(start)
+
+        # the workers write their own documents, only the merged index is left for the coordinator
+        if self.sites_index.dirty:
+            self.sites_index.write(self.write_buffer)
+
+    def fetch_parse(self, batch_size=100):
+        with self.fetcher.open() as f:
+            if f is None:
+                self.parse(None)
+                return
+
+            self.cycle += 1
+            start = time.monotonic()
+            with update_seconds.time(('parse',)):
+                for tasks in self.tasks:
+                    tasks.put((self.cycle, STREAMED))
+
+                # sites are handed on in small batches as they're read, the whole payload is never held here
+                batches = [list() for _ in range(self.shards)]
+                try:
+                    for site in iter_array(f):
+                        site_id = site.get('id', None)
+                        if site_id is None:
+                            log_warning("site 'id' not found", site)
+                            continue
+                        shard = shard_of(site_id, self.shards)
+                        batches[shard].append(site)
+                        if len(batches[shard]) == batch_size:
+                            self.tasks[shard].put(batches[shard])
+                            batches[shard] = list()
+                finally:
+                    # every worker gets the end of the cycle, even one cut short, or it would wait on its queue forever
+                    for shard, batch in enumerate(batches):
+                        if batch:
+                            self.tasks[shard].put(batch)
+                        self.tasks[shard].put(list())
+                self.collect(start)
+
+        if self.sites_index.dirty:
+            self.sites_index.write(self.write_buffer)
+
+    def collect(self, start, poll_interval=1):
+        pending = set(range(self.shards))
+        waited = 0
+        while pending:
+            try:
+                result = self.results.get(timeout=poll_interval)
+            except queue.Empty:
+                # a dead worker's sites are lost for this cycle, a new one picks them up from the next
+                for shard in sorted(pending):
+                    if not self.workers[shard].is_alive():
+                        logging.error("shard {} worker exited with {}, restarting it".format(
+                            shard,
+                            self.workers[shard].exitcode
+                        ))
+                        self.restarts += 1
+                        self.start_worker(shard)
+                        pending.discard(shard)
+
+                waited += poll_interval
+                if pending and waited >= self.timeout:
+                    logging.warning("still waiting on shards {}".format(sorted(pending)))
+                    waited = 0
+                continue
+
+            # results left over from a cycle abandoned after a worker died don't count for this one
+            if result['cycle'] != self.cycle:
+                continue
+
+            shard = result['shard']
+            pending.discard(shard)
+            self.lag[shard] = time.monotonic() - start
+
+            if result['error'] is not None:
+                logging.warning("shard {} failed: {}".format(shard, result['error']))
+            self.sites_index.merge(result['index'])
+
+            if registry.enabled:
+                shard_lag.set(self.lag[shard], (shard,))
+                shard_sites.set(result['sites'], (shard,))
+                shard_writes.set(result['writes'], (shard,))
+
+        logging.info("shard lag {}".format(", ".join("{} {:.3f}s".format(shard, lag) for shard, lag in enumerate(self.lag))))
+
+    def persist(self):
+        with update_seconds.time(('persist',)):
+            self.write_buffer.flush()
@@ -0,0 +1,111 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+class SharedCache:
+    # expires at (unix time), then the number of fields, each field is length prefixed bytes
+    header = struct.Struct('<dI')
+    field_header = struct.Struct('<I')
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # entries already read by this process, by key, kept until the file is replaced
+        self.entries = dict()
+        self.lock = threading.Lock()
+
+        self.builds = 0
+        self.stale_hits = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, '{}.bin'.format(key))
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        # files are replaced, never rewritten, so inode and mtime identify a version
+        version = (stat.st_ino, stat.st_mtime_ns)
+        entry = self.entries.get(key, None)
+        if entry is not None and entry[0] == version:
+            return entry[1], entry[2]
+
+        # the map stays open and fields are views into it, so every process serves the same page cache pages rather
+        # than a copy of its own; the map is released once the entry is replaced and no response still holds a view
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        expires, cnt = self.header.unpack_from(view, 0)
+        offset = self.header.size
+        fields = list()
+        for _ in range(cnt):
+            size, = self.field_header.unpack_from(view, offset)
+            offset += self.field_header.size
+            fields.append(view[offset:(offset + size)])
+            offset += size
+
+        self.entries[key] = (version, expires, fields)
+        return expires, fields
+
+    def store(self, key, fields, expires):
+        path = self.path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(self.header.pack(expires, len(fields)))
+            for field in fields:
+                f.write(self.field_header.pack(len(field)))
+                f.write(field)
+        os.replace(tmp_path, path)
+
+    def get(self, key, ttl, build):
+        with self.lock:
+            entry = self.load(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+        # single flight, only the process holding the lock rebuilds and everyone else keeps serving what they have
+        lock = open('{}.lock'.format(self.path(key)), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (fcntl.LOCK_NB if entry is not None else 0))
+        except BlockingIOError:
+            lock.close()
+            self.stale_hits += 1
+            return entry[1]
+
+        if entry is None:
+            # nothing to serve yet, so this request has to wait for the build
+            return self.refresh(key, ttl, build, lock)
+
+        # stale while revalidate, even the process that rebuilds answers from the old entry meanwhile
+        thread = threading.Thread(target=self.refresh, args=(key, ttl, build, lock), name='refresh-{}'.format(key), daemon=True)
+        thread.start()
+        self.stale_hits += 1
+        return entry[1]
+
+    def refresh(self, key, ttl, build, lock):
+        try:
+            # whoever held the lock before may have just refreshed it
+            with self.lock:
+                entry = self.load(key)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+
+            # a build that has nothing to offer leaves the current entry, stale or not, in place
+            fields = build()
+            if fields is None:
+                return entry[1] if entry is not None else None
+            self.store(key, fields, time.time() + ttl)
+            self.builds += 1
+            with self.lock:
+                return self.load(key)[1]
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
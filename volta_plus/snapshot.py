@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from volta_plus.metrics import registry
+
+
+snapshot_seconds = registry.timer('volta_snapshot_seconds', "time spent capturing, writing and restoring snapshots", ('stage',))
+snapshot_bytes = registry.gauge('volta_snapshot_bytes', "size of the last snapshot written")
+
+SNAPSHOT_VERSION = 2
+
+
+def write_snapshot(path, header, arrays):
+    # an uncompressed npz, the json header rides along as a byte array so the whole snapshot is one file
+    header = np.frombuffer(json.dumps(header, separators=(',', ':')).encode(), dtype=np.uint8)
+
+    # written aside and renamed over the old one, so a crash leaves either snapshot whole
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, header=header, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+    return os.path.getsize(path)
+
+
+def read_snapshot(path):
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path, allow_pickle=False) as npz:
+        header = json.loads(npz['header'].tobytes().decode())
+        if header.get('version', None) != SNAPSHOT_VERSION:
+            logging.warning("ignoring snapshot {} with version {}".format(path, header.get('version', None)))
+            return None
+        arrays = {name: npz[name] for name in npz.files if name != 'header'}
+
+    return header, arrays
+
+
+class SnapshotWriter:
+    def __init__(self, path, interval=300):
+        self.path = path
+        self.interval = interval
+        self.captured = time.monotonic()
+
+        self.thread = None
+
+        self.capture_time = 0
+        self.write_time = 0
+        self.size = 0
+
+    def due(self):
+        # a write still running is left to finish, the next cycle captures again
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        return time.monotonic() - self.captured >= self.interval
+
+    def submit(self, header, arrays, capture_time):
+        self.captured = time.monotonic()
+        self.capture_time = capture_time
+        if registry.enabled:
+            snapshot_seconds.observe(capture_time, ('capture',))
+
+        self.thread = threading.Thread(target=self.write, args=(header, arrays), name='snapshot', daemon=True)
+        self.thread.start()
+
+    def write(self, header, arrays):
+        start = time.perf_counter()
+        try:
+            self.size = write_snapshot(self.path, header, arrays)
+        except Exception as e:
+            logging.exception(e)
+            return
+        self.write_time = time.perf_counter() - start
+
+        if registry.enabled:
+            snapshot_seconds.observe(self.write_time, ('write',))
+            snapshot_bytes.set(self.size)
+        logging.info("wrote snapshot of {} meters ({} bytes) to {}, captured in {:.3f}s and written in {:.3f}s".format(
+            header['meters'],
+            self.size,
+            self.path,
+            self.capture_time,
+            self.write_time
+        ))
+
+    def close(self):
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,300 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+
+class Storage(ABC):
+    def get(self, collection, doc_id, field_paths=None):
+        return self.get_many(collection, [doc_id], field_paths).get(doc_id, None)
+
+    @abstractmethod
+    def get_many(self, collection, doc_ids, field_paths=None):
+        pass
+
+    @abstractmethod
+    def put_many(self, writes):
+        pass
+
+    @abstractmethod
+    def stream(self, collection, field_paths=None):
+        pass
+
+    @abstractmethod
+    def watch(self, collection, callback):
+        pass
+
+    def reference(self, collection, doc_id):
+        return '{}/{}'.format(collection, doc_id)
+
+    def reference_id(self, reference):
+        return reference.rsplit('/', 1)[-1]
+
+    def close(self):
+        pass
+
+
+def copy_doc(value):
+    # documents only hold json like values, which is far cheaper to walk than copy.deepcopy
+    if isinstance(value, dict):
+        return {key: copy_doc(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_doc(item) for item in value] if value and isinstance(value[0], (dict, list)) else list(value)
+    return value
+
+
+def select_fields(doc, field_paths):
+    if field_paths is None:
+        return doc
+    return {field: doc[field] for field in field_paths if field in doc}
+
+
+class FirestoreStorage(Storage):
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # the firestore client is slow to import and needs credentials, so only create it on first use
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google.cloud import firestore
+                    self._client = firestore.Client()
+        return self._client
+
+    def get(self, collection, doc_id, field_paths=None):
+        return self.client.collection(collection).document(doc_id).get(field_paths).to_dict()
+
+    def get_many(self, collection, doc_ids, field_paths=None):
+        doc_refs = [self.client.collection(collection).document(doc_id) for doc_id in doc_ids]
+        return {
+            snapshot.id: snapshot.to_dict()
+            for snapshot in self.client.get_all(doc_refs, field_paths=field_paths)
+            if snapshot.exists
+        }
+
+    def put_many(self, writes):
+        batch = self.client.batch()
+        for collection, doc_id, data in writes:
+            batch.set(self.client.collection(collection).document(doc_id), data)
+        batch.commit()
+
+    def stream(self, collection, field_paths=None):
+        query = self.client.collection(collection)
+        if field_paths is not None:
+            query = query.select(field_paths)
+        for snapshot in query.stream():
+            yield snapshot.id, snapshot.to_dict()
+
+    def watch(self, collection, callback):
+        def on_snapshot(docs, changes, read_time):
+            for change in changes:
+                if change.type.name in ('ADDED', 'MODIFIED'):
+                    callback(change.document.id, change.document.to_dict())
+
+        return self.client.collection(collection).on_snapshot(on_snapshot)
+
+    def reference(self, collection, doc_id):
+        return self.client.collection(collection).document(doc_id)
+
+    def reference_id(self, reference):
+        return reference.id
+
+
+class MemoryWatch:
+    def __init__(self, storage, collection, callback):
+        self.storage = storage
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self.storage.lock:
+            self.storage.watches[self.collection].remove(self)
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collections = defaultdict(dict)
+        self.watches = defaultdict(list)
+
+    def get_many(self, collection, doc_ids, field_paths=None):
+        with self.lock:
+            docs = self.collections[collection]
+            found = {doc_id: docs[doc_id] for doc_id in doc_ids if doc_id in docs}
+        return {doc_id: copy_doc(select_fields(doc, field_paths)) for doc_id, doc in found.items()}
+
+    def put_many(self, writes):
+        # copy on the way in and out so callers never share mutable state with the store
+        writes = [(collection, doc_id, copy_doc(data)) for collection, doc_id, data in writes]
+        with self.lock:
+            for collection, doc_id, data in writes:
+                self.collections[collection][doc_id] = data
+            watches = [(watch, doc_id, data) for collection, doc_id, data in writes for watch in self.watches[collection]]
+
+        for watch, doc_id, data in watches:
+            watch.callback(doc_id, copy_doc(data))
+
+    def stream(self, collection, field_paths=None):
+        with self.lock:
+            docs = list(self.collections[collection].items())
+        for doc_id, doc in docs:
+            yield doc_id, copy_doc(select_fields(doc, field_paths))
+
+    def watch(self, collection, callback):
+        watch = MemoryWatch(self, collection, callback)
+        with self.lock:
+            self.watches[collection].append(watch)
+        return watch
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def decode_object(obj):
+    if len(obj) == 1 and '$datetime' in obj:
+        value = datetime.fromisoformat(obj['$datetime'])
+        # like firestore, hand back timezone aware utc times
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+    return obj
+
+
+class SQLiteWatch:
+    def __init__(self, storage, collection, callback, interval):
+        self.storage = storage
+        self.collection = collection
+        self.callback = callback
+        self.interval = interval
+
+        self.stopped = threading.Event()
+        self.seq = storage.last_seq(collection)
+        self.thread = threading.Thread(target=self.run, name='sqlite-watch-{}'.format(collection), daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                for doc_id, doc, seq in self.storage.changes(self.collection, self.seq):
+                    self.seq = seq
+                    self.callback(doc_id, doc)
+            except Exception as e:
+                logging.exception(e)
+
+    def unsubscribe(self):
+        self.stopped.set()
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path, watch_interval=1):
+        self.path = path
+        self.watch_interval = watch_interval
+        self.local = threading.local()
+
+        with self.connection as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    collection TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    PRIMARY KEY (collection, id)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS docs_seq ON docs (collection, seq)")
+
+    @property
+    def connection(self):
+        # sqlite connections can't be shared across threads, each thread opens its own
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get_many(self, collection, doc_ids, field_paths=None):
+        found = dict()
+        doc_ids = list(doc_ids)
+        # stay under sqlite's bound parameter limit
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:(i + 500)]
+            rows = self.connection.execute(
+                "SELECT id, data FROM docs WHERE collection = ? AND id IN ({})".format(','.join('?' * len(chunk))),
+                [collection] + chunk
+            )
+            for doc_id, data in rows:
+                found[doc_id] = select_fields(json.loads(data, object_hook=decode_object), field_paths)
+        return found
+
+    def put_many(self, writes):
+        with self.connection as connection:
+            # take the write lock before reading the sequence, or concurrent writers hand out the same numbers
+            # and a watch that has moved past them never sees the other writer's changes
+            connection.execute("BEGIN IMMEDIATE")
+            seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM docs").fetchone()[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO docs (collection, id, data, seq) VALUES (?, ?, ?, ?)",
+                [
+                    (collection, doc_id, json.dumps(data, default=encode_value), seq + i + 1)
+                    for i, (collection, doc_id, data) in enumerate(writes)
+                ]
+            )
+
+    def stream(self, collection, field_paths=None):
+        rows = self.connection.execute("SELECT id, data FROM docs WHERE collection = ?", (collection,))
+        for doc_id, data in rows:
+            yield doc_id, select_fields(json.loads(data, object_hook=decode_object), field_paths)
+
+    def last_seq(self, collection):
+        return self.connection.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM docs WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+
+    def changes(self, collection, seq):
+        rows = self.connection.execute(
+            "SELECT id, data, seq FROM docs WHERE collection = ? AND seq > ? ORDER BY seq", (collection, seq)
+        ).fetchall()
+        for doc_id, data, seq in rows:
+            yield doc_id, json.loads(data, object_hook=decode_object), seq
+
+    def watch(self, collection, callback):
+        # other processes write to the same file, so changes are picked up by polling the sequence column
+        return SQLiteWatch(self, collection, callback, self.watch_interval)
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+def create_storage(url):
+    if url == 'firestore':
+        return FirestoreStorage()
+    if url == 'memory':
+        return MemoryStorage()
+    if url.startswith('sqlite:///'):
+        return SQLiteStorage(url[len('sqlite:///'):])
+    raise ValueError("unknown storage {!r}, expected firestore, memory or sqlite:///path".format(url))
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(os.environ.get('VOLTA_STORAGE', 'firestore'))
+    return _storage
@@ -0,0 +1,64 @@
+import codecs
+import json
+
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_delimiters = _whitespace + ',]'
+
+def iter_array(fp, chunk_size=65536):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+
+    # '[' opens the array, then a value or ']' for an empty one, then ',' or ']' after every value
+    expect = '['
+    while True:
+        while pos < len(buf) and buf[pos] in _whitespace:
+            pos += 1
+
+        need_more = pos == len(buf)
+        if not need_more and expect == 'value':
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                need_more = True
+            else:
+                # a value not followed by a delimiter may have been cut short, e.g. a number
+                need_more = not eof and (end == len(buf) or buf[end] not in _delimiters)
+
+        if need_more:
+            if eof:
+                raise ValueError("unexpected end of JSON array")
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + decoder.decode(chunk, final=eof)
+            pos = 0
+            continue
+
+        if expect == 'value':
+            yield value
+            pos = end
+            expect = ','
+            continue
+
+        char = buf[pos]
+        pos += 1
+        if expect == '[':
+            if char != '[':
+                raise ValueError("expected '[' at the start of a JSON array, found {!r}".format(char))
+            expect = 'first'
+        elif expect == 'first' and char == ']':
+            return
+        elif expect == 'first':
+            pos -= 1
+            expect = 'value'
+        elif char == ',':
+            expect = 'value'
+        elif char == ']':
+            return
+        else:
+            raise ValueError("expected ',' or ']' in a JSON array, found {!r}".format(char))
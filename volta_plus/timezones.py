@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+import time
+
+import pytz
+from timezonefinder import TimezoneFinder
+
+from volta_plus.metrics import registry
+
+
+lookup_seconds = registry.timer('volta_timezone_lookup_seconds', "time per timezone lookup that missed the cache")
+
+_timezones = dict()
+
+def get_timezone(zone):
+    timezone = _timezones.get(zone, None)
+    if timezone is None:
+        timezone = pytz.timezone(zone)
+        _timezones[zone] = timezone
+    return timezone
+
+
+class TimezoneCache:
+    def __init__(self, path=None, maxsize=65536, precision=4):
+        self.path = path
+        self.maxsize = maxsize
+        self.precision = precision
+
+        self.zones = OrderedDict()
+        self.dirty = False
+
+        # TimezoneFinder takes a while to load and isn't needed at all when every lookup hits
+        self.tf = None
+
+        self.hits = 0
+        self.misses = 0
+        self.lookup_time = 0
+        self.lookups = 0
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    @property
+    def time_saved(self):
+        return self.hits * (self.lookup_time / self.lookups) if self.lookups else 0
+
+    def zone_at(self, lng, lat):
+        key = (round(lng, self.precision), round(lat, self.precision))
+        if key in self.zones:
+            self.zones.move_to_end(key)
+            self.hits += 1
+            return self.zones[key]
+
+        if self.tf is None:
+            self.tf = TimezoneFinder(in_memory=True)
+
+        start = time.perf_counter()
+        zone = self.tf.timezone_at(lng=lng, lat=lat)
+        elapsed = time.perf_counter() - start
+        self.lookup_time += elapsed
+        if registry.enabled:
+            lookup_seconds.observe(elapsed)
+        self.lookups += 1
+        self.misses += 1
+
+        self.zones[key] = zone
+        if len(self.zones) > self.maxsize:
+            self.zones.popitem(last=False)
+        self.dirty = True
+
+        return zone
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                for lng, lat, zone in json.load(f):
+                    self.zones[(lng, lat)] = zone
+        except (OSError, ValueError) as e:
+            logging.exception(e)
+            self.zones.clear()
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump([[lng, lat, zone] for (lng, lat), zone in self.zones.items()], f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False